@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.embeddings import embeddings_available, encode_query, model_slug
+from app.extraction_cache import ExtractionCache
+from app.json_store import file_stamp
+from app.query_cache import normalize_question
+
+# Minimum cosine similarity between question embeddings for a cached answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", 0.92))
+# Answers kept per document, and how long one stays valid
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 200))
+ANSWER_CACHE_MAX_AGE_SECONDS = float(os.environ.get("ANSWER_CACHE_MAX_AGE_SECONDS", 7 * 24 * 3600))
+
+# Scope used for answers over the whole library rather than one document
+LIBRARY_SCOPE = "library"
+
+
+class SemanticAnswerCache:
+    """Persistent per-document cache of LLM answers, matched by question similarity and retrieved chunks"""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, extraction_cache: ExtractionCache, similarity: float = ANSWER_CACHE_SIMILARITY,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, max_age_seconds: float = ANSWER_CACHE_MAX_AGE_SECONDS):
+        self.extraction_cache = extraction_cache
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        # scope -> (file stamp, entries), loaded from disk on first use
+        self.entries: Dict[str, Tuple[Optional[Tuple[int, int, int]], List[Dict]]] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def answers_name(self) -> str:
+        # Question embeddings are only comparable within one embedding model
+        slug = model_slug() if embeddings_available() else "exact"
+        return f"answers_v{self.FORMAT_VERSION}_{slug}.json.z"
+
+    def answers_path(self, scope: str) -> Path:
+        return self.extraction_cache.artifact_path(scope, self.answers_name())
+
+    def entries_of(self, payload: Optional[Dict]) -> List[Dict]:
+        return payload['entries'] if payload and payload.get('version') == self.FORMAT_VERSION else []
+
+    def load_entries(self, scope: str) -> List[Dict]:
+        """Entries of a scope, reloaded when another process replaced the file; caller holds the lock"""
+        stamp = file_stamp(self.answers_path(scope))
+        cached = self.entries.get(scope)
+        if cached is None or cached[0] != stamp:
+            # Also covers invalidated artifacts: the stamp of a missing file is None
+            entries = self.entries_of(self.extraction_cache.load_json(scope, self.answers_name()))
+            cached = self.entries[scope] = (stamp, entries)
+        return cached[1]
+
+    @staticmethod
+    def question_key(question: str, query_vector: Optional[np.ndarray] = None) -> Dict:
+        """Embedding of a question, or its normalized text when embeddings are unavailable"""
+        if embeddings_available():
+            if query_vector is None:
+                query_vector = encode_query(question)
+            return {'embedding': np.round(query_vector, 5).tolist()}
+        return {'normalized': normalize_question(question)}
+
+    def is_match(self, entry: Dict, key: Dict) -> bool:
+        if 'embedding' in key:
+            stored = entry.get('embedding')
+            if stored is None or len(stored) != len(key['embedding']):
+                return False
+            return float(np.dot(stored, key['embedding'])) >= self.similarity
+        return entry.get('normalized') == key['normalized']
+
+    def lookup(self, scope: str, key: Dict, chunk_ids: Sequence[str]) -> Optional[Dict]:
+        """Cached {'answer', 'sources'} for a similar question over the same chunks, or None"""
+        chunk_ids = sorted(chunk_ids)
+        now = time.time()
+        with self.lock:
+            for entry in self.load_entries(scope):
+                if entry['chunk_ids'] != chunk_ids or now - entry['created'] > self.max_age_seconds:
+                    continue
+                if self.is_match(entry, key):
+                    self.hits += 1
+                    return {'answer': entry['answer'], 'sources': [dict(source) for source in entry['sources']]}
+            self.misses += 1
+        return None
+
+    def store(self, scope: str, question: str, key: Dict, chunk_ids: Sequence[str],
+              answer: str, sources: List[Dict]):
+        """Persist an answer, evicting expired entries and then the oldest beyond the size limit"""
+        if self.max_entries <= 0:
+            return
+        entry = {
+            'question': question,
+            'chunk_ids': sorted(chunk_ids),
+            'answer': answer,
+            'sources': sources,
+            'created': time.time()
+        }
+        entry.update(key)
+        now = entry['created']
+
+        def add_entry(payload: Optional[Dict]) -> Dict:
+            # Merged into what is on disk now, so answers stored by other processes are kept
+            entries = [e for e in self.entries_of(payload) if now - e['created'] <= self.max_age_seconds]
+            entries.append(entry)
+            return {'version': self.FORMAT_VERSION, 'entries': entries[-self.max_entries:]}
+
+        with self.lock:
+            self.extraction_cache.update_json(scope, self.answers_name(), add_entry, None)
+            # Reloaded on the next lookup; another process may already have written after this one
+            self.entries.pop(scope, None)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache(extraction_cache: ExtractionCache) -> SemanticAnswerCache:
+    """Return the process-wide answer cache"""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(extraction_cache)
+        return _answer_cache
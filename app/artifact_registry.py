@@ -0,0 +1,74 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Generic, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+# Artifacts of one kind kept open per process; page stores hold a file descriptor and a mapping each
+OPEN_ARTIFACTS_MAX = int(os.environ.get("OPEN_ARTIFACTS_MAX", 64))
+
+
+class ArtifactRegistry(Generic[T]):
+    """Process-wide LRU of artifacts loaded from the extraction cache, keyed by file path
+
+    Artifacts live in a directory named after their content hash, which is how evict()
+    finds every artifact of one document. Evicted artifacts are passed to `close`.
+    """
+
+    def __init__(self, max_entries: int = OPEN_ARTIFACTS_MAX, close: Optional[Callable[[T], None]] = None):
+        self.max_entries = max(1, max_entries)
+        self.close = close
+        self.entries: 'OrderedDict[Path, T]' = OrderedDict()
+        self.lock = threading.RLock()
+        _registries.append(self)
+
+    def get(self, path: Path) -> Optional[T]:
+        """Open artifact at a path, or None; marks it most recently used"""
+        with self.lock:
+            item = self.entries.get(path)
+            if item is not None:
+                self.entries.move_to_end(path)
+            return item
+
+    def put(self, path: Path, item: T):
+        """Register a freshly loaded artifact, closing the least recently used ones past the limit"""
+        with self.lock:
+            previous = self.entries.pop(path, None)
+            self.entries[path] = item
+            evicted = [previous] if previous is not None and previous is not item else []
+            while len(self.entries) > self.max_entries:
+                evicted.append(self.entries.popitem(last=False)[1])
+        self._close_all(evicted)
+
+    def discard(self, path: Path):
+        """Drop and close the artifact at a path, e.g. after its file was invalidated"""
+        with self.lock:
+            item = self.entries.pop(path, None)
+        self._close_all([item] if item is not None else [])
+
+    def evict(self, content_hash: str):
+        """Drop and close every artifact of one file content"""
+        with self.lock:
+            paths = [path for path in self.entries if path.parent.name == content_hash]
+            evicted = [self.entries.pop(path) for path in paths]
+        self._close_all(evicted)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _close_all(self, items: List[T]):
+        if self.close is None:
+            return
+        for item in items:
+            self.close(item)
+
+
+_registries: List[ArtifactRegistry] = []
+
+
+def evict_artifacts(content_hash: str):
+    """Close every open artifact of a file content, in every registry"""
+    for registry in list(_registries):
+        registry.evict(content_hash)
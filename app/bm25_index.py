@@ -0,0 +1,149 @@
+import heapq
+import json
+import math
+import re
+import zlib
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from app.artifact_registry import ArtifactRegistry
+from app.json_store import atomic_write_bytes
+
+TERM_PATTERN = re.compile(r"\w+")
+
+# Very common English words carry no ranking signal but have the longest postings lists
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or
+our she so than that the their them then there these they this to was we were what when where which who
+why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word terms with stopwords removed"""
+    return [term for term in TERM_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+class BM25Index:
+    """Inverted index over a document's chunks with Okapi BM25 scoring"""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, postings: Dict[str, Tuple[array, array]], doc_lengths: array,
+                 k1: float = 1.5, b: float = 0.75):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> 'BM25Index':
+        """Build postings, term frequencies and document lengths from chunk texts"""
+        postings: Dict[str, Tuple[array, array]] = {}
+        doc_lengths = array('I')
+        for doc_id, text in enumerate(texts):
+            terms = tokenize(text)
+            doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array('I'), array('I'))
+                entry[0].append(doc_id)
+                entry[1].append(tf)
+        return cls(postings, doc_lengths, k1, b)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency (always positive)"""
+        entry = self.postings.get(term)
+        df = len(entry[0]) if entry else 0
+        n = len(self.doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def query_weight(self, query: str) -> float:
+        """Summed IDF of the query's terms, including those absent from this index"""
+        return sum(self.idf(term) for term in set(tokenize(query)))
+
+    def score(self, query: str) -> Dict[int, float]:
+        """BM25 score of every chunk containing at least one query term"""
+        scores: Dict[int, float] = {}
+        if not self.doc_lengths:
+            return scores
+
+        k1, b, avgdl = self.k1, self.b, self.avg_doc_length or 1.0
+        doc_lengths = self.doc_lengths
+        # Only the postings of the query terms are visited
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in zip(entry[0], entry[1]):
+                norm = k1 * (1 - b + b * doc_lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Top-k (chunk_id, score) pairs, best first; ties go to the earlier chunk"""
+        scores = self.score(query)
+        return heapq.nsmallest(top_k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def top_terms(self, count: int = 20) -> List[str]:
+        """Most characteristic terms of the document: total term frequency weighted by IDF"""
+        weights = {
+            term: sum(tfs) * self.idf(term)
+            for term, (ids, tfs) in self.postings.items()
+            if len(term) > 2 and not term.isdigit()
+        }
+        return [term for term, _ in heapq.nsmallest(count, weights.items(), key=lambda item: (-item[1], item[0]))]
+
+    def save(self, path: Path):
+        """Atomically write the index as compressed JSON"""
+        payload = {
+            'version': self.FORMAT_VERSION,
+            'k1': self.k1,
+            'b': self.b,
+            'doc_lengths': self.doc_lengths.tolist(),
+            'postings': {term: [ids.tolist(), tfs.tolist()] for term, (ids, tfs) in self.postings.items()}
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(path, zlib.compress(
+            json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 1
+        ))
+
+    @classmethod
+    def load(cls, path: Path) -> 'BM25Index':
+        """Load an index written by save()"""
+        with open(path, 'rb') as f:
+            payload = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        postings = {
+            term: (array('I', ids), array('I', tfs))
+            for term, (ids, tfs) in payload['postings'].items()
+        }
+        return cls(postings, array('I', payload['doc_lengths']), payload['k1'], payload['b'])
+
+    @staticmethod
+    def index_name(chunker_key: str) -> str:
+        return f"bm25_v{BM25Index.FORMAT_VERSION}_{chunker_key}.json.z"
+
+
+_open_indexes: ArtifactRegistry[BM25Index] = ArtifactRegistry()
+
+
+def open_bm25_index(path: Path) -> BM25Index:
+    """Return a process-wide shared index, loading it from disk on first use"""
+    with _open_indexes.lock:
+        index = _open_indexes.get(path)
+        if index is not None and not path.exists():
+            # Artifacts were invalidated; drop the stale index
+            _open_indexes.discard(path)
+            index = None
+        if index is None:
+            index = BM25Index.load(path)
+            _open_indexes.put(path, index)
+        return index
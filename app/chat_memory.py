@@ -1,10 +1,10 @@
-import json
 import datetime
 import uuid
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Callable
 import streamlit as st
 from datetime import datetime
+from app.json_store import atomic_write_json, file_lock, read_json, update_json
 
 def parse_datetime(dt):
     if isinstance(dt, str):
@@ -25,21 +25,16 @@ class ChatMemoryManager:
     
     def load_threads_index(self) -> List[Dict]:
         """Load threads index from JSON file"""
-        if self.threads_index_file.exists():
-            try:
-                with open(self.threads_index_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                return []
-        return []
-    
-    def save_threads_index(self, threads: List[Dict]):
-        """Save threads index to JSON file"""
-        # Sort threads by updated_at (most recent first)
-        threads.sort(key=lambda x: parse_datetime(x["updated_at"]), reverse=True)
-        
-        with open(self.threads_index_file, 'w', encoding='utf-8') as f:
-            json.dump(threads, f, indent=2, default=str, ensure_ascii=False)
+        return read_json(self.threads_index_file, [])
+    
+    def update_threads_index(self, mutate: Callable[[List[Dict]], List[Dict]]) -> List[Dict]:
+        """Apply a change to the threads index without losing concurrent changes from other sessions"""
+        def mutate_and_sort(threads: List[Dict]) -> List[Dict]:
+            threads = mutate(threads)
+            # Sort threads by updated_at (most recent first)
+            threads.sort(key=lambda x: parse_datetime(x["updated_at"]), reverse=True)
+            return threads
+        return update_json(self.threads_index_file, mutate_and_sort, [])
     
     def create_new_thread(self, pdf_file_id: str, pdf_filename: str, first_question: str) -> str:
         """Create a new chat thread"""
@@ -58,9 +53,7 @@ class ChatMemoryManager:
         }
         
         # Add to threads index
-        threads = self.load_threads_index()
-        threads.insert(0, thread_data)  # Add at the beginning (most recent)
-        self.save_threads_index(threads)
+        self.update_threads_index(lambda threads: [thread_data] + threads)
         
         # Create empty chat history file
         self.save_thread_messages(thread_id, [])
@@ -71,8 +64,8 @@ class ChatMemoryManager:
         """Save messages for a specific thread"""
         thread_file = self.chat_threads_dir / f"{thread_id}.json"
         
-        with open(thread_file, 'w', encoding='utf-8') as f:
-            json.dump(messages, f, indent=2, default=str, ensure_ascii=False)
+        with file_lock(thread_file):
+            atomic_write_json(thread_file, messages)
         
         # Update message count and timestamp in index
         self.update_thread_metadata(thread_id, {
@@ -84,31 +77,23 @@ class ChatMemoryManager:
         """Load messages for a specific thread"""
         thread_file = self.chat_threads_dir / f"{thread_id}.json"
         
-        if thread_file.exists():
-            try:
-                with open(thread_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                return []
-        return []
+        return read_json(thread_file, [])
     
     def update_thread_metadata(self, thread_id: str, updates: Dict) -> bool:
         """Update thread metadata in the index - FIXED to return success status"""
         try:
-            threads = self.load_threads_index()
+            if self.get_thread_by_id(thread_id) is None:
+                return False
             
-            thread_found = False
-            for thread in threads:
-                if thread['thread_id'] == thread_id:
-                    thread.update(updates)
-                    thread_found = True
-                    break
+            def apply_updates(threads: List[Dict]) -> List[Dict]:
+                for thread in threads:
+                    if thread['thread_id'] == thread_id:
+                        thread.update(updates)
+                        break
+                return threads
             
-            if thread_found:
-                self.save_threads_index(threads)
-                return True
-            else:
-                return False
+            self.update_threads_index(apply_updates)
+            return True
                 
         except Exception as e:
             st.error(f"Error updating thread metadata: {str(e)}")
@@ -129,18 +114,14 @@ class ChatMemoryManager:
     def delete_thread(self, thread_id: str) -> bool:
         """Delete a chat thread - ENHANCED error handling"""
         try:
-            # Remove from index
-            threads = self.load_threads_index()
-            original_count = len(threads)
-            threads = [t for t in threads if t['thread_id'] != thread_id]
-            
-            # Check if thread was actually found and removed
-            if len(threads) == original_count:
+            # Check if thread is in the index
+            if self.get_thread_by_id(thread_id) is None:
                 # Thread wasn't found in index
                 st.warning(f"Thread {thread_id} not found in index")
                 return False
             
-            self.save_threads_index(threads)
+            # Remove from index
+            self.update_threads_index(lambda threads: [t for t in threads if t['thread_id'] != thread_id])
             
             # Delete thread file
             thread_file = self.chat_threads_dir / f"{thread_id}.json"
@@ -165,8 +146,6 @@ class ChatMemoryManager:
     
     def add_message_to_thread(self, thread_id: str, question: str, answer: str, sources: Optional[List[Dict]] = None):
         """Add a new message pair to a thread"""
-        messages = self.load_thread_messages(thread_id)
-        
         message_pair = {
             'question': question,
             'answer': answer,
@@ -174,8 +153,20 @@ class ChatMemoryManager:
             'timestamp': datetime.now().isoformat()
         }
         
-        messages.append(message_pair)
-        self.save_thread_messages(thread_id, messages)
+        thread_file = self.chat_threads_dir / f"{thread_id}.json"
+        update_json(thread_file, lambda messages: messages + [message_pair], [])
+        
+        # Count inside the index update rather than from our own append: another session may
+        # append in between, and whichever index update runs last then still sees every message
+        def record_message(threads: List[Dict]) -> List[Dict]:
+            for thread in threads:
+                if thread['thread_id'] == thread_id:
+                    thread['message_count'] = len(read_json(thread_file, []))
+                    thread['updated_at'] = datetime.now().isoformat()
+                    break
+            return threads
+        
+        self.update_threads_index(record_message)
     
     def search_threads(self, query: str) -> List[Dict]:
         """Search threads by title or content"""
@@ -202,24 +193,25 @@ class ChatMemoryManager:
     def cleanup_orphaned_threads(self, valid_pdf_ids: List[str]) -> int:
         """Remove threads for PDFs that no longer exist - FIXED return count"""
         try:
-            threads = self.load_threads_index()
-            valid_threads = []
-            deleted_count = 0
+            valid_pdf_ids = set(valid_pdf_ids)
+            if all(t.get('pdf_file_id') in valid_pdf_ids for t in self.load_threads_index()):
+                return 0
             
-            for thread in threads:
-                if thread.get('pdf_file_id') in valid_pdf_ids:
-                    valid_threads.append(thread)
-                else:
-                    # Delete orphaned thread file
-                    thread_file = self.chat_threads_dir / f"{thread['thread_id']}.json"
-                    if thread_file.exists():
-                        thread_file.unlink()
-                    deleted_count += 1
+            # mutate may run again on a fresher index, so it only records what the last run removed
+            orphaned: List[Dict] = []
+            def drop_orphans(threads: List[Dict]) -> List[Dict]:
+                orphaned[:] = [t for t in threads if t.get('pdf_file_id') not in valid_pdf_ids]
+                return [t for t in threads if t.get('pdf_file_id') in valid_pdf_ids]
+            
+            self.update_threads_index(drop_orphans)
             
-            if deleted_count > 0:
-                self.save_threads_index(valid_threads)
+            # Delete orphaned thread files once they are out of the index
+            for thread in orphaned:
+                thread_file = self.chat_threads_dir / f"{thread['thread_id']}.json"
+                if thread_file.exists():
+                    thread_file.unlink()
             
-            return deleted_count
+            return len(orphaned)
             
         except Exception as e:
             st.error(f"Error cleaning up orphaned threads: {str(e)}")
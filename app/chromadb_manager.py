@@ -0,0 +1,107 @@
+import importlib.util
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHROMA_DIR = Path("chroma_db")
+COLLECTION_NAME = "document_chunks"
+# Rows per upsert call; keeps request size bounded for very large documents
+UPSERT_BATCH_SIZE = 1000
+
+
+def chromadb_available() -> bool:
+    """Whether the chromadb package is installed"""
+    return importlib.util.find_spec("chromadb") is not None
+
+
+class ChromaDBManager:
+    """Persistent HNSW vector store for chunk embeddings across every uploaded document"""
+
+    def __init__(self, persist_dir: Path = CHROMA_DIR):
+        import chromadb
+        from chromadb.config import Settings
+
+        self.persist_dir = persist_dir
+        self.client = chromadb.PersistentClient(
+            path=str(persist_dir),
+            settings=Settings(anonymized_telemetry=False)
+        )
+        self.documents_collection = self.client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    @staticmethod
+    def chunk_record_id(file_id: str, chunk_id: int) -> str:
+        return f"{file_id}:{chunk_id}"
+
+    def upsert_chunks(self, file_id: str, embeddings: np.ndarray,
+                      page_starts: Sequence[int], page_ends: Sequence[int]):
+        """Insert or replace every chunk embedding of a file, in batches"""
+        count = embeddings.shape[0]
+        for start in range(0, count, UPSERT_BATCH_SIZE):
+            stop = min(start + UPSERT_BATCH_SIZE, count)
+            self.documents_collection.upsert(
+                ids=[self.chunk_record_id(file_id, chunk_id) for chunk_id in range(start, stop)],
+                embeddings=np.asarray(embeddings[start:stop], dtype=np.float32).tolist(),
+                metadatas=[
+                    {
+                        'file_id': file_id,
+                        'chunk_id': chunk_id,
+                        'page_number': int(page_starts[chunk_id]),
+                        'page_end': int(page_ends[chunk_id])
+                    }
+                    for chunk_id in range(start, stop)
+                ]
+            )
+
+    def query(self, query_embedding: np.ndarray, n_results: int = 5,
+              file_ids: Optional[List[str]] = None) -> List[Dict]:
+        """Nearest chunks to a query embedding, optionally restricted to some files"""
+        where = None
+        if file_ids:
+            where = {'file_id': file_ids[0]} if len(file_ids) == 1 else {'file_id': {'$in': list(file_ids)}}
+
+        result = self.documents_collection.query(
+            query_embeddings=[np.asarray(query_embedding, dtype=np.float32).tolist()],
+            n_results=n_results,
+            where=where,
+            include=['metadatas', 'distances']
+        )
+        matches = []
+        for metadata, distance in zip(result['metadatas'][0], result['distances'][0]):
+            matches.append({
+                'file_id': metadata['file_id'],
+                'chunk_id': int(metadata['chunk_id']),
+                'page_number': metadata.get('page_number'),
+                'score': 1.0 - float(distance)
+            })
+        return matches
+
+    def has_file(self, file_id: str) -> bool:
+        """Whether any chunk of a file is stored"""
+        return bool(self.documents_collection.get(where={'file_id': file_id}, limit=1, include=[])['ids'])
+
+    def delete_file(self, file_id: str):
+        """Remove every chunk of a file"""
+        self.documents_collection.delete(where={'file_id': file_id})
+
+
+_manager: Optional[ChromaDBManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_chromadb_manager() -> Optional[ChromaDBManager]:
+    """Return the process-wide ChromaDB client, or None if chromadb is not installed"""
+    global _manager
+    if not chromadb_available():
+        return None
+    with _manager_lock:
+        if _manager is None:
+            _manager = ChromaDBManager()
+        return _manager
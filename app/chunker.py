@@ -0,0 +1,125 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, Tuple
+
+# Words and individual punctuation marks; a cheap stand-in for LLM subword tokens
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Joins consecutive pages in a document's text
+PAGE_SEPARATOR = "\n\n"
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in a string"""
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+
+class ChunkSpan:
+    """A chunk described by offsets into the document text rather than a copied string"""
+
+    __slots__ = ('chunk_id', 'start', 'end', 'page_start', 'page_end', 'token_count')
+
+    def __init__(self, chunk_id: int, start: int, end: int, page_start: int, page_end: int, token_count: int):
+        self.chunk_id = chunk_id
+        self.start = start
+        self.end = end
+        self.page_start = page_start
+        self.page_end = page_end
+        self.token_count = token_count
+
+    def __repr__(self) -> str:
+        return (f"ChunkSpan(chunk_id={self.chunk_id}, start={self.start}, end={self.end}, "
+                f"pages={self.page_start}-{self.page_end}, tokens={self.token_count})")
+
+
+class OffsetChunker:
+    """Token-budgeted chunker with overlap that works on character offsets"""
+
+    def __init__(self, max_tokens: int = 256, overlap_tokens: int = 32, cross_pages: bool = True):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive")
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be between 0 and max_tokens - 1")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.cross_pages = cross_pages
+
+    @property
+    def cache_key(self) -> str:
+        """Identifies the chunker parameters in cache artifact names"""
+        return f"t{self.max_tokens}o{self.overlap_tokens}{'x' if self.cross_pages else 'p'}"
+
+    def iter_page_chunks(self, pages: Iterable[Dict], byte_offsets: bool = False) -> Iterator[ChunkSpan]:
+        """Yield chunks while pages stream in, without joining them into one buffer
+
+        Offsets index the page texts joined with PAGE_SEPARATOR; with byte_offsets they
+        index the UTF-8 encoding of that text instead. Only the token offsets of the
+        current window are retained, never earlier page texts.
+        """
+        separator_length = len(PAGE_SEPARATOR)
+        # (token start, page number) of the tokens in the current window
+        window = deque()
+        window_end = 0
+        window_end_page = 0
+        fresh_tokens = 0
+        chunk_id = 0
+        page_start = 0
+
+        for index, page in enumerate(pages):
+            if index:
+                page_start += separator_length
+            content = page['content']
+            page_number = page['page_number']
+
+            if not self.cross_pages and fresh_tokens:
+                yield self._make_page_chunk(chunk_id, window, window_end, window_end_page)
+                chunk_id += 1
+            if not self.cross_pages:
+                window.clear()
+                fresh_tokens = 0
+
+            for token_start, token_end in self._iter_token_offsets(content, page_start, byte_offsets):
+                window.append((token_start, page_number))
+                window_end = token_end
+                window_end_page = page_number
+                fresh_tokens += 1
+
+                if len(window) == self.max_tokens:
+                    yield self._make_page_chunk(chunk_id, window, window_end, window_end_page)
+                    chunk_id += 1
+                    fresh_tokens = 0
+                    while len(window) > self.overlap_tokens:
+                        window.popleft()
+
+            page_start += len(content.encode('utf-8')) if byte_offsets else len(content)
+
+        if fresh_tokens:
+            yield self._make_page_chunk(chunk_id, window, window_end, window_end_page)
+
+    @staticmethod
+    def _iter_token_offsets(content: str, base: int, byte_offsets: bool) -> Iterator[Tuple[int, int]]:
+        """Token start and end offsets within one page, shifted by the page's start offset"""
+        if not byte_offsets or content.isascii():
+            for match in TOKEN_PATTERN.finditer(content):
+                yield base + match.start(), base + match.end()
+            return
+        # Encode only the gaps between tokens and the tokens themselves: one pass over the page
+        char_pos = 0
+        byte_pos = base
+        for match in TOKEN_PATTERN.finditer(content):
+            token_start = byte_pos + len(content[char_pos:match.start()].encode('utf-8'))
+            token_end = token_start + len(match.group().encode('utf-8'))
+            yield token_start, token_end
+            char_pos = match.end()
+            byte_pos = token_end
+
+    @staticmethod
+    def _make_page_chunk(chunk_id: int, window: deque, window_end: int, window_end_page: int) -> ChunkSpan:
+        start, page_start = window[0]
+        return ChunkSpan(
+            chunk_id=chunk_id,
+            start=start,
+            end=window_end,
+            page_start=page_start,
+            page_end=window_end_page,
+            token_count=len(window)
+        )
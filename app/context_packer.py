@@ -0,0 +1,174 @@
+import os
+import re
+from typing import Dict, FrozenSet, List, Optional
+
+from app.chunker import TOKEN_PATTERN, count_tokens
+
+# Approximate tokens of retrieved content sent to the LLM per question
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 2000))
+# Word-shingle Jaccard similarity at which a chunk counts as a near-duplicate of a better-ranked one
+CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTEXT_DUPLICATE_THRESHOLD", 0.8))
+# A passage that crosses the budget is truncated only if at least this many tokens still fit
+CONTEXT_MIN_PARTIAL_TOKENS = 64
+
+SHINGLE_SIZE = 3
+# Shortest overlap looked for when stitching adjacent chunks back together
+STITCH_PROBE_CHARS = 8
+
+
+def shingles(text: str) -> FrozenSet[str]:
+    """Set of lowercase word trigrams, used for near-duplicate detection"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def stitch(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping the text they overlap on"""
+    probe = second[:STITCH_PROBE_CHARS]
+    if probe:
+        index = first.find(probe)
+        while index != -1:
+            if second.startswith(first[index:]):
+                return first[:index] + second
+            index = first.find(probe, index + 1)
+    return f"{first} {second}"
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Prefix of a text holding at most max_tokens tokens"""
+    end = 0
+    for count, match in enumerate(TOKEN_PATTERN.finditer(text), start=1):
+        if count > max_tokens:
+            break
+        end = match.end()
+    return text[:end]
+
+
+class PackedPassage:
+    """One or more adjacent chunks merged into a single prompt passage"""
+
+    __slots__ = ('rank', 'sources', 'text', 'tokens')
+
+    def __init__(self, rank: int, source: Dict):
+        self.rank = rank
+        self.sources = [source]
+        self.text = source['content']
+        self.tokens = 0
+
+    @property
+    def last(self) -> Dict:
+        return self.sources[-1]
+
+    def is_followed_by(self, source: Dict) -> bool:
+        """Whether a source is the next chunk of the same file, starting on the page this passage ends on"""
+        last = self.last
+        # Summary-tree nodes carry no chunk id and are never merged
+        if source['chunk_id'] is None or last['chunk_id'] is None:
+            return False
+        return (source.get('file_id') == last.get('file_id')
+                and source['chunk_id'] == last['chunk_id'] + 1
+                and source['page_number'] == last.get('page_end', last['page_number']))
+
+    def append(self, rank: int, source: Dict):
+        self.rank = min(self.rank, rank)
+        self.sources.append(source)
+        self.text = stitch(self.text, source['content'])
+
+
+class PackedContext:
+    """Prompt passages that fit the token budget, and the sources behind them"""
+
+    def __init__(self, passages: List[PackedPassage], tokens_used: int, budget: int,
+                 candidates: int, duplicates: int):
+        self.passages = passages
+        self.tokens_used = tokens_used
+        self.budget = budget
+        self.candidates = candidates
+        self.duplicates = duplicates
+
+    @property
+    def texts(self) -> List[str]:
+        return [passage.text for passage in self.passages]
+
+    @property
+    def sources(self) -> List[Dict]:
+        """Sources whose text reached the prompt, best-ranked passage first"""
+        return [source for passage in self.passages for source in passage.sources]
+
+    def report(self) -> Dict:
+        return {
+            'tokens_used': self.tokens_used,
+            'token_budget': self.budget,
+            'candidates': self.candidates,
+            'duplicates_removed': self.duplicates,
+            'passages': len(self.passages),
+            'chunks_used': len(self.sources)
+        }
+
+
+class ContextPacker:
+    """Turns ranked chunk sources into a deduplicated, merged, token-budgeted prompt context"""
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+
+    def deduplicate(self, sources: List[Dict]) -> List[Dict]:
+        """Drop chunks that nearly repeat a better-ranked chunk"""
+        kept: List[Dict] = []
+        kept_shingles: List[FrozenSet[str]] = []
+        for source in sources:
+            source_shingles = shingles(source['content'])
+            if any(jaccard(source_shingles, other) >= self.duplicate_threshold for other in kept_shingles):
+                continue
+            kept.append(source)
+            kept_shingles.append(source_shingles)
+        return kept
+
+    @staticmethod
+    def merge_adjacent(sources: List[Dict]) -> List[PackedPassage]:
+        """Merge consecutive chunks of the same page into passages, ordered by their best rank"""
+        ranked = sorted(
+            enumerate(sources),
+            key=lambda item: (str(item[1].get('file_id')), item[1]['chunk_id'] is None, item[1]['chunk_id'] or 0)
+        )
+        passages: List[PackedPassage] = []
+        for rank, source in ranked:
+            if passages and passages[-1].is_followed_by(source):
+                passages[-1].append(rank, source)
+            else:
+                passages.append(PackedPassage(rank, source))
+        passages.sort(key=lambda passage: passage.rank)
+        return passages
+
+    def pack(self, sources: List[Dict], token_budget: Optional[int] = None) -> PackedContext:
+        """Pack ranked sources (best first) into at most token_budget tokens"""
+        budget = self.token_budget if token_budget is None else token_budget
+        unique = self.deduplicate(sources)
+
+        packed: List[PackedPassage] = []
+        tokens_used = 0
+        for passage in self.merge_adjacent(unique):
+            passage.tokens = count_tokens(passage.text)
+            remaining = budget - tokens_used
+            if passage.tokens > remaining:
+                if remaining >= CONTEXT_MIN_PARTIAL_TOKENS or not packed:
+                    passage.text = truncate_tokens(passage.text, remaining)
+                    passage.tokens = count_tokens(passage.text)
+                    if passage.tokens:
+                        packed.append(passage)
+                        tokens_used += passage.tokens
+                break
+            packed.append(passage)
+            tokens_used += passage.tokens
+
+        return PackedContext(packed, tokens_used, budget, len(sources), len(sources) - len(unique))
@@ -0,0 +1,88 @@
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.bm25_index import BM25Index, tokenize
+from app.pdf_processor import PDFProcessor
+
+logger = logging.getLogger(__name__)
+
+# Documents kept by the first (document-level) stage of library retrieval
+ROUTING_TOP_DOCUMENTS = int(os.environ.get("ROUTING_TOP_DOCUMENTS", 5))
+# Keywords stored per document at ingestion
+ROUTING_KEYWORD_COUNT = int(os.environ.get("ROUTING_KEYWORD_COUNT", 30))
+ROUTING_SEMANTIC_WEIGHT = float(os.environ.get("ROUTING_SEMANTIC_WEIGHT", 1.0))
+ROUTING_KEYWORD_WEIGHT = float(os.environ.get("ROUTING_KEYWORD_WEIGHT", 0.5))
+
+
+def document_keywords(bm25: BM25Index, count: int = ROUTING_KEYWORD_COUNT) -> List[str]:
+    """Top keywords of a document, stored in its metadata entry for routing"""
+    return bm25.top_terms(count)
+
+
+class DocumentRouter:
+    """First retrieval stage: picks the few documents most likely to answer a question"""
+
+    def __init__(self, pdf_processor: PDFProcessor, top_documents: int = ROUTING_TOP_DOCUMENTS,
+                 semantic_weight: float = ROUTING_SEMANTIC_WEIGHT,
+                 keyword_weight: float = ROUTING_KEYWORD_WEIGHT):
+        self.pdf_processor = pdf_processor
+        self.top_documents = top_documents
+        self.semantic_weight = semantic_weight
+        self.keyword_weight = keyword_weight
+
+    def get_centroid(self, file_id: str, file_info: Dict) -> Optional[np.ndarray]:
+        """A document's centroid, or None if ingestion did not compute one"""
+        content_hash = file_info.get('content_hash')
+        if not content_hash:
+            return None
+        try:
+            return self.pdf_processor.open_cached_document_centroid(content_hash)
+        except Exception:
+            logger.exception("Could not load document centroid for %s", file_id)
+            return None
+
+    def score(self, question: str, candidates: List[Tuple[str, Dict]],
+              query_vector: Optional[np.ndarray]) -> Tuple[Dict[str, float], List[str]]:
+        """Routing score per document, plus the documents that have no representation to score"""
+        query_terms = set(tokenize(question))
+        scores: Dict[str, float] = {}
+        unrouted: List[str] = []
+
+        centroid_ids: List[str] = []
+        centroids: List[np.ndarray] = []
+        for file_id, file_info in candidates:
+            keywords = file_info.get('keywords')
+            centroid = self.get_centroid(file_id, file_info) if query_vector is not None else None
+            if keywords is None and centroid is None:
+                # Ingested before routing existed; never drop it silently
+                unrouted.append(file_id)
+                continue
+
+            keyword_score = 0.0
+            if keywords and query_terms:
+                keyword_score = len(query_terms.intersection(keywords)) / len(query_terms)
+            scores[file_id] = self.keyword_weight * keyword_score
+            if centroid is not None:
+                centroid_ids.append(file_id)
+                centroids.append(centroid)
+
+        if centroids:
+            # One matrix product scores every document centroid against the question
+            similarities = np.vstack(centroids) @ query_vector
+            for file_id, similarity in zip(centroid_ids, similarities):
+                scores[file_id] += self.semantic_weight * float(similarity)
+        return scores, unrouted
+
+    def route(self, question: str, candidates: List[Tuple[str, Dict]],
+              query_vector: Optional[np.ndarray] = None, top_n: Optional[int] = None) -> List[str]:
+        """File ids whose chunks should be searched for the question"""
+        top_n = self.top_documents if top_n is None else top_n
+        if top_n <= 0 or len(candidates) <= top_n:
+            return [file_id for file_id, _ in candidates]
+
+        scores, unrouted = self.score(question, candidates, query_vector)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [file_id for file_id, _ in ranked[:top_n]] + unrouted
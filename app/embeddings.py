@@ -0,0 +1,163 @@
+import importlib.util
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.artifact_registry import ArtifactRegistry
+from app.json_store import atomic_output
+
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Texts handed to the model per encode() call while streaming chunks into the matrix
+ENCODE_BATCH_SIZE = 64
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def embeddings_available() -> bool:
+    """Whether sentence-transformers is installed"""
+    return importlib.util.find_spec("sentence_transformers") is not None
+
+
+def get_embedding_model():
+    """Return the process-wide sentence-transformers model, loading it on first use"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        return _model
+
+
+def encode_texts(texts: List[str]) -> np.ndarray:
+    """Encode texts into L2-normalized float32 vectors"""
+    vectors = get_embedding_model().encode(
+        texts,
+        batch_size=ENCODE_BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def encode_query(text: str) -> np.ndarray:
+    """Encode a single query into a normalized vector"""
+    return encode_texts([text])[0]
+
+
+def model_slug() -> str:
+    """Embedding model name made safe for artifact file names"""
+    return re.sub(r'[^A-Za-z0-9]+', '-', EMBEDDING_MODEL_NAME).strip('-')
+
+
+def _batched(texts: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class EmbeddingIndex:
+    """Brute-force cosine search over a memory-mapped matrix of chunk embeddings"""
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @staticmethod
+    def index_name(chunker_key: str) -> str:
+        return f"embeddings_{model_slug()}_{chunker_key}.npy"
+
+    @staticmethod
+    def centroid_name(chunker_key: str) -> str:
+        return f"centroid_{model_slug()}_{chunker_key}.npy"
+
+    @classmethod
+    def build(cls, path: Path, texts: Iterable[str], count: int) -> 'EmbeddingIndex':
+        """Encode texts in batches straight into an .npy file on disk"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        dimension = get_embedding_model().get_sentence_embedding_dimension()
+
+        with atomic_output(path) as tmp_path:
+            matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(count, dimension))
+            row = 0
+            for batch in _batched(texts, ENCODE_BATCH_SIZE * 4):
+                vectors = encode_texts(batch)
+                matrix[row:row + len(vectors)] = vectors
+                row += len(vectors)
+            matrix.flush()
+            del matrix
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'EmbeddingIndex':
+        """Memory-map a saved embedding matrix read-only"""
+        return cls(np.load(path, mmap_mode='r'))
+
+    def centroid(self) -> np.ndarray:
+        """Normalized mean of all chunk embeddings, used as a document-level vector"""
+        if len(self) == 0:
+            return np.zeros(self.matrix.shape[1], dtype=np.float32)
+        mean = np.asarray(self.matrix.mean(axis=0), dtype=np.float32)
+        norm = np.linalg.norm(mean)
+        return mean / norm if norm else mean
+
+    def search_vector(self, query_vector: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Top-k (chunk_id, cosine similarity) pairs, best first"""
+        count = len(self)
+        if count == 0 or top_k <= 0:
+            return []
+        scores = self.matrix @ query_vector
+        top_k = min(top_k, count)
+        # argpartition finds the top-k in linear time; only those k are sorted
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(i), float(scores[i])) for i in candidates]
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Encode a query once and return its top-k chunks"""
+        return self.search_vector(encode_query(query), top_k)
+
+
+_open_indexes: ArtifactRegistry[EmbeddingIndex] = ArtifactRegistry()
+
+
+def open_embedding_index(path: Path) -> Optional[EmbeddingIndex]:
+    """Return a process-wide shared embedding index, or None if it has not been built"""
+    with _open_indexes.lock:
+        if not path.exists():
+            # Never built, or artifacts were invalidated
+            _open_indexes.discard(path)
+            return None
+        index = _open_indexes.get(path)
+        if index is None:
+            index = EmbeddingIndex.load(path)
+            _open_indexes.put(path, index)
+        return index
+
+
+_open_centroids: ArtifactRegistry[np.ndarray] = ArtifactRegistry()
+
+
+def open_document_centroid(path: Path) -> Optional[np.ndarray]:
+    """Return a process-wide cached document centroid, or None if it has not been computed"""
+    with _open_centroids.lock:
+        if not path.exists():
+            _open_centroids.discard(path)
+            return None
+        centroid = _open_centroids.get(path)
+        if centroid is None:
+            centroid = np.load(path)
+            _open_centroids.put(path, centroid)
+        return centroid
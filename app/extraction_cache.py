@@ -0,0 +1,99 @@
+import hashlib
+import json
+import shutil
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.artifact_registry import evict_artifacts
+from app.json_store import atomic_write_bytes, update_json
+
+
+class ExtractionCache:
+    """Disk-backed cache of extraction artifacts keyed by file content hash"""
+
+    # (path, mtime_ns, size) -> sha256, so reselecting a file does not rehash it
+    _hash_memo: Dict[Tuple[str, int, int], str] = {}
+    _hash_memo_lock = threading.Lock()
+
+    def __init__(self, cache_dir: Path = Path("uploads") / "cache"):
+        self.cache_dir = cache_dir
+        self.ensure_directories()
+
+    def ensure_directories(self):
+        """Create necessary directories if they don't exist"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def compute_content_hash(cls, file_path: Path, block_size: int = 1024 * 1024) -> str:
+        """Return the SHA-256 hex digest of a file, memoized by mtime and size"""
+        stat = file_path.stat()
+        memo_key = (str(file_path.resolve()), stat.st_mtime_ns, stat.st_size)
+        with cls._hash_memo_lock:
+            cached = cls._hash_memo.get(memo_key)
+        if cached:
+            return cached
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+
+        with cls._hash_memo_lock:
+            cls._hash_memo[memo_key] = content_hash
+        return content_hash
+
+    @classmethod
+    def remember_content_hash(cls, file_path: Path, content_hash: str):
+        """Seed the memo with a hash computed while the file was written"""
+        stat = file_path.stat()
+        with cls._hash_memo_lock:
+            cls._hash_memo[(str(file_path.resolve()), stat.st_mtime_ns, stat.st_size)] = content_hash
+
+    def artifact_dir(self, content_hash: str) -> Path:
+        """Directory holding every cached artifact for one file content"""
+        return self.cache_dir / content_hash
+
+    def artifact_path(self, content_hash: str, name: str) -> Path:
+        """Path of a named artifact for one file content"""
+        return self.artifact_dir(content_hash) / name
+
+    @staticmethod
+    def read_compressed_json(path: Path, default: Any = None) -> Any:
+        """Parsed compressed JSON file, or default if missing or unreadable"""
+        try:
+            with open(path, 'rb') as f:
+                return json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except (OSError, zlib.error, ValueError):
+            return default
+
+    @staticmethod
+    def write_compressed_json(path: Path, data: Any):
+        """Atomically write a compressed JSON file"""
+        atomic_write_bytes(path, zlib.compress(
+            json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+            1
+        ))
+
+    def load_json(self, content_hash: str, name: str) -> Optional[Any]:
+        """Load a compressed JSON artifact, or None if missing or unreadable"""
+        return self.read_compressed_json(self.artifact_path(content_hash, name))
+
+    def save_json(self, content_hash: str, name: str, data: Any):
+        """Atomically write a compressed JSON artifact"""
+        path = self.artifact_path(content_hash, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.write_compressed_json(path, data)
+
+    def update_json(self, content_hash: str, name: str, mutate: Callable[[Any], Any], default: Any) -> Any:
+        """Read-modify-write a compressed JSON artifact without losing other processes' updates"""
+        path = self.artifact_path(content_hash, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return update_json(path, mutate, default, load=self.read_compressed_json, dump=self.write_compressed_json)
+
+    def invalidate(self, content_hash: str):
+        """Remove every cached artifact for a file content, closing any this process has open"""
+        evict_artifacts(content_hash)
+        shutil.rmtree(self.artifact_dir(content_hash), ignore_errors=True)
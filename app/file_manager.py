@@ -1,14 +1,34 @@
 import streamlit as st
-import json
+import hashlib
+import logging
 import datetime
+import os
+import threading
 import uuid
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import BinaryIO, Callable, List, Dict, Mapping, Set, Tuple, Optional
+from app.extraction_cache import ExtractionCache
+from app.json_store import file_lock, fsync_directory
+from app.metadata_store import get_metadata_store, metadata_cache
+from app.query_cache import bump_index_version
+from app.chromadb_manager import CHROMA_DIR, get_chromadb_manager
 
+logger = logging.getLogger(__name__)
+
+# Bytes read from an upload per write while it is hashed; bounds the writer's memory per upload
+UPLOAD_BLOCK_SIZE = int(os.environ.get("UPLOAD_BLOCK_SIZE", 1024 * 1024))
+# Largest accepted upload. Streamlit buffers a whole upload in server memory before it is written
+# here, so this is also RAM per concurrent upload. Streamlit's own limit (server.maxUploadSize in
+# .streamlit/config.toml, or STREAMLIT_SERVER_MAX_UPLOAD_SIZE) must allow it too
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", os.environ.get("STREAMLIT_SERVER_MAX_UPLOAD_SIZE", 200)))
+# A PDF must start with this signature, which readers accept anywhere in the first kilobyte
+PDF_HEADER = b"%PDF-"
+PDF_HEADER_WINDOW = 1024
+
+# Upload directories whose legacy metadata and files this process has already migrated
+_prepared_uploads: Set[Path] = set()
+_prepared_uploads_lock = threading.Lock()
 
-# Gemini API imports
-from google.generativeai.generative_models import GenerativeModel
-from google.generativeai.client import configure
 
 class FileManager:
     """Utility class for file and metadata management"""
@@ -16,73 +36,221 @@ class FileManager:
     def __init__(self):
         self.uploads_dir = Path("uploads")
         self.metadata_file = self.uploads_dir / "file_data.json"
+        self.metadata_db = self.uploads_dir / "file_data.db"
+        self.blobs_dir = self.uploads_dir / "blobs"
         self.ensure_directories()
+        self.extraction_cache = ExtractionCache(self.uploads_dir / "cache")
+        self.metadata_store = get_metadata_store(self.metadata_db)
+        self.prepare_uploads()
+    
+    def prepare_uploads(self):
+        """Migrate legacy metadata and uploads once per process rather than on every rerun"""
+        uploads_dir = self.uploads_dir.resolve()
+        with _prepared_uploads_lock:
+            if uploads_dir in _prepared_uploads:
+                return
+            self.metadata_store.migrate_from_json(self.metadata_file)
+            self.adopt_legacy_uploads()
+            _prepared_uploads.add(uploads_dir)
     
     def ensure_directories(self):
         """Create necessary directories if they don't exist"""
         self.uploads_dir.mkdir(exist_ok=True)
+        self.blobs_dir.mkdir(exist_ok=True)
     
-    def load_metadata(self) -> Dict:
-        """Load metadata from JSON file"""
-        if self.metadata_file.exists():
-            try:
-                with open(self.metadata_file, 'r') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                return {}
-        return {}
+    def load_metadata(self) -> Mapping[str, Mapping]:
+        """Read-only metadata of every file keyed by file ID, from the process-wide cache"""
+        return metadata_cache.get(self.metadata_store)
     
     def save_metadata(self, metadata: Dict):
-        """Save metadata to JSON file"""
-        with open(self.metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=2, default=str)
+        """Replace all stored metadata with the given entries"""
+        self.metadata_store.replace_all(metadata)
+    
+    def get_file_info(self, file_id: str) -> Optional[Dict]:
+        """Metadata of one file, or None"""
+        return self.metadata_store.get(file_id)
     
-    def add_file_metadata(self, filename: str, filesize: int, file_id: Optional[str] = None) -> str:
+    def find_files_by_content_hash(self, content_hash: str) -> List[Dict]:
+        """Metadata of every file sharing one stored blob"""
+        return self.metadata_store.find_by_content_hash(content_hash)
+    
+    def get_file_ids_by_status(self, status: str) -> List[str]:
+        """IDs of every file with a given status"""
+        return self.metadata_store.ids_with_status(status)
+    
+    def get_storage_totals(self) -> Dict:
+        """Number of files and their total size"""
+        return self.metadata_store.totals()
+    
+    def add_file_metadata(self, filename: str, filesize: int, file_id: Optional[str] = None,
+                          content_hash: Optional[str] = None) -> str:
         """Add file metadata and return file ID"""
         if file_id is None:
             file_id = str(uuid.uuid4())
         
-        metadata = self.load_metadata()
-        metadata[file_id] = {
+        self.metadata_store.upsert(file_id, {
             'filename': filename,
             'filesize': filesize,
             'created_at': datetime.datetime.now(),
             'status': 'uploading',
-            'file_id': file_id
-        }
-        self.save_metadata(metadata)
+            'file_id': file_id,
+            'content_hash': content_hash
+        })
         return file_id
     
+    def blob_path(self, content_hash: str) -> Path:
+        """Content-addressed location of an upload, sharded by hash prefix"""
+        return self.blobs_dir / content_hash[:2] / content_hash[2:4] / f"{content_hash}.pdf"
+    
+    @property
+    def blob_lock_path(self) -> Path:
+        # Serializes reference changes against blob removal across sessions and processes
+        return self.blobs_dir / "refs"
+    
+    @staticmethod
+    def max_upload_size() -> int:
+        """Upload size limit in bytes"""
+        return MAX_UPLOAD_MB * 1024 * 1024
+    
+    def write_upload(self, source: BinaryIO,
+                     progress: Optional[Callable[[int], None]] = None) -> Tuple[Path, str, int]:
+        """Copy an upload to a temp file block by block, hashing it on the way; returns (temp path, sha256, size)"""
+        tmp_path = self.blobs_dir / f"upload.{os.getpid()}.{threading.get_ident()}.tmp"
+        digest = hashlib.sha256()
+        head = b''
+        size = 0
+        max_size = self.max_upload_size()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for block in iter(lambda: source.read(UPLOAD_BLOCK_SIZE), b''):
+                    # Validate as soon as the header window has arrived, before writing the rest
+                    if len(head) < PDF_HEADER_WINDOW:
+                        head += block[:PDF_HEADER_WINDOW - len(head)]
+                        if len(head) == PDF_HEADER_WINDOW and PDF_HEADER not in head:
+                            raise ValueError("Not a PDF file: the %PDF- header is missing")
+                    size += len(block)
+                    if size > max_size:
+                        raise ValueError(f"File size exceeds the {MAX_UPLOAD_MB}MB limit")
+                    digest.update(block)
+                    f.write(block)
+                    if progress is not None:
+                        progress(size)
+                # Blobs are never rewritten once published, so the bytes must be on disk first
+                f.flush()
+                os.fsync(f.fileno())
+            if PDF_HEADER not in head:
+                raise ValueError("Not a PDF file: the %PDF- header is missing")
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return tmp_path, digest.hexdigest(), size
+    
+    def add_uploaded_file(self, filename: str, source: BinaryIO,
+                          progress: Optional[Callable[[int], None]] = None) -> Tuple[Optional[str], List[Dict]]:
+        """Store an upload by content; returns (new file ID, files that already had that content)"""
+        # The file ID is None when the same content was already uploaded under the same name
+        tmp_path, content_hash, size = self.write_upload(source, progress)
+        try:
+            with file_lock(self.blob_lock_path):
+                duplicates = self.find_files_by_content_hash(content_hash)
+                if any(info['filename'] == filename for info in duplicates):
+                    return None, duplicates
+                
+                blob_path = self.blob_path(content_hash)
+                if not blob_path.exists() or blob_path.stat().st_size != size:
+                    self.publish_blob(tmp_path, blob_path)
+                self.extraction_cache.remember_content_hash(blob_path, content_hash)
+                file_id = self.add_file_metadata(filename, size, content_hash=content_hash)
+                return file_id, duplicates
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    
+    def publish_blob(self, source: Path, blob_path: Path):
+        """Durably move a complete file to its content address"""
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, blob_path)
+        # Persist the rename and any shard directories it created
+        for directory in (blob_path.parent, blob_path.parent.parent, self.blobs_dir):
+            fsync_directory(directory)
+    
+    def adopt_legacy_uploads(self):
+        """Move files stored under their original name into the blob store and record their hash"""
+        # Without a hash, duplicate detection and reference counting would not see these files
+        for file_info in self.metadata_store.find_without_content_hash():
+            legacy_path = self.uploads_dir / file_info['filename']
+            if not legacy_path.exists():
+                continue
+            content_hash = self.extraction_cache.compute_content_hash(legacy_path)
+            with file_lock(self.blob_lock_path):
+                # Another process may have adopted it while this one hashed
+                current = self.get_file_info(file_info['file_id'])
+                if current is None or current.get('content_hash') or not legacy_path.exists():
+                    continue
+                blob_path = self.blob_path(content_hash)
+                if blob_path.exists():
+                    legacy_path.unlink()
+                else:
+                    self.publish_blob(legacy_path, blob_path)
+                    fsync_directory(self.uploads_dir)
+                self.extraction_cache.remember_content_hash(blob_path, content_hash)
+                self.metadata_store.update(file_info['file_id'], {'content_hash': content_hash})
+                logger.info("Moved %s into the blob store as %s", legacy_path, content_hash)
+    
     def update_file_status(self, file_id: str, status: str):
         """Update file status"""
-        metadata = self.load_metadata()
-        if file_id in metadata:
-            metadata[file_id]['status'] = status
-            self.save_metadata(metadata)
+        self.metadata_store.update(file_id, {'status': status})
+    
+    def update_file_metadata(self, file_id: str, updates: Dict):
+        """Merge extra fields into a file's metadata entry"""
+        self.metadata_store.update(file_id, updates)
     
     def delete_file(self, file_id: str):
         """Delete file and its metadata"""
-        metadata = self.load_metadata()
-        if file_id in metadata:
-            filename = metadata[file_id]['filename']
-            file_path = self.uploads_dir / filename
+        file_info = self.get_file_info(file_id)
+        if file_info is not None:
+            content_hash = file_info.get('content_hash')
+            if content_hash:
+                # The blob and its cached artifacts go with the last file referencing them
+                with file_lock(self.blob_lock_path):
+                    self.metadata_store.delete(file_id)
+                    if self.metadata_store.count_by_content_hash(content_hash) == 0:
+                        self.extraction_cache.invalidate(content_hash)
+                        self.blob_path(content_hash).unlink(missing_ok=True)
+            else:
+                # Uploads from before content addressing whose file could not be adopted
+                file_path = self.uploads_dir / file_info['filename']
+                self.metadata_store.delete(file_id)
+                if file_path.exists():
+                    legacy_hash = self.extraction_cache.compute_content_hash(file_path)
+                    with file_lock(self.blob_lock_path):
+                        if self.metadata_store.count_by_content_hash(legacy_hash) == 0:
+                            self.extraction_cache.invalidate(legacy_hash)
+                    file_path.unlink()
             
-            # Delete physical file
-            if file_path.exists():
-                file_path.unlink()
-            
-            # Remove from metadata
-            del metadata[file_id]
-            self.save_metadata(metadata)
+            # Vectors are stored per file ID, so each duplicate has its own
+            self.delete_vectors(file_id)
+            bump_index_version(file_id)
             return True
         return False
     
+    def delete_vectors(self, file_id: str):
+        """Remove a file's chunk embeddings from the vector store, if one has been created"""
+        if not CHROMA_DIR.exists():
+            return
+        try:
+            manager = get_chromadb_manager()
+            if manager is not None:
+                manager.delete_file(file_id)
+        except Exception:
+            logger.exception("Failed to delete vectors for %s", file_id)
+    
     def get_file_path(self, file_id: str) -> Optional[Path]:
         """Get file path from file ID"""
-        metadata = self.load_metadata()
-        if file_id in metadata:
-            filename = metadata[file_id]['filename']
-            return self.uploads_dir / filename
+        file_info = self.get_file_info(file_id)
+        if file_info is not None:
+            if file_info.get('content_hash'):
+                return self.blob_path(file_info['content_hash'])
+            return self.uploads_dir / file_info['filename']
         return None
     
     @staticmethod
@@ -0,0 +1,141 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+from app.file_manager import FileManager
+from app.pdf_processor import PDFProcessor
+from app.bm25_index import BM25Index
+from app.chromadb_manager import get_chromadb_manager
+from app.document_router import document_keywords
+from app.query_cache import bump_index_version
+from app.summarizer import get_document_summarizer
+from app.summary_tree import SUMMARY_TREE_AT_INGESTION, open_summary_tree
+from app.embeddings import EmbeddingIndex
+from app.page_store import MappedPageStore
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionPipeline:
+    """Runs extraction, chunking and indexing for uploaded files on background threads"""
+
+    def __init__(self, file_manager: FileManager, max_workers: int = 2):
+        self.file_manager = file_manager
+        self.pdf_processor = PDFProcessor()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self.jobs: Dict[str, Future] = {}
+        self.jobs_lock = threading.Lock()
+
+    def submit(self, file_id: str) -> Future:
+        """Queue a file for ingestion; a file already queued or running is not queued twice"""
+        with self.jobs_lock:
+            job = self.jobs.get(file_id)
+            if job is not None and not job.done():
+                return job
+            self.file_manager.update_file_status(file_id, 'processing')
+            job = self.executor.submit(self.ingest, file_id)
+            self.jobs[file_id] = job
+            return job
+
+    def resume_pending(self):
+        """Requeue files left uploading or processing, e.g. by a server restart, and finished files missing artifacts"""
+        # An 'uploading' row is only written after its blob is published, so a leftover one means the
+        # process stopped between storing the upload and submitting it
+        for status in ('uploading', 'processing'):
+            for file_id in self.file_manager.get_file_ids_by_status(status):
+                file_path = self.file_manager.get_file_path(file_id)
+                if file_path and file_path.exists():
+                    self.submit(file_id)
+
+        # Uploads from before background ingestion (or with a deleted cache) would otherwise be parsed by a query
+        for file_id in self.file_manager.get_file_ids_by_status('success'):
+            file_info = self.file_manager.get_file_info(file_id)
+            content_hash = file_info.get('content_hash') if file_info else None
+            if content_hash and not self.pdf_processor.has_artifacts(content_hash):
+                self.submit(file_id)
+
+    def ingest(self, file_id: str) -> bool:
+        """Ingest one file and record the outcome in its metadata status"""
+        try:
+            file_path = self.file_manager.get_file_path(file_id)
+            if not file_path or not file_path.exists():
+                raise FileNotFoundError(f"Uploaded file for {file_id} not found")
+
+            # Extraction and chunking land in the extraction cache, so the chat page loads them instantly
+            store = self.pdf_processor.open_page_store(file_path)
+            if not store.page_count:
+                raise ValueError("No pages could be extracted from the PDF")
+
+            # Retrieval indexes are persisted next to the page store
+            bm25 = self.pdf_processor.open_bm25_index(file_path)
+            embedding_index = self.build_embeddings(file_id, file_path)
+            if embedding_index is not None:
+                self.index_in_chromadb(file_id, store, embedding_index)
+
+            # Document-level representation for the routing stage of library search
+            self.build_document_profile(file_id, file_path, bm25, embedding_index)
+            if SUMMARY_TREE_AT_INGESTION:
+                self.build_summary_tree(file_id, file_path, store)
+
+            self.file_manager.update_file_status(file_id, 'success')
+            return True
+        except Exception:
+            logger.exception("Ingestion failed for %s", file_id)
+            self.file_manager.update_file_status(file_id, 'error')
+            return False
+        finally:
+            # Results cached against the previous index of this file are stale now
+            bump_index_version(file_id)
+
+    def build_embeddings(self, file_id: str, file_path: Path) -> Optional[EmbeddingIndex]:
+        """Encode chunk embeddings; keyword retrieval still works if this fails"""
+        try:
+            return self.pdf_processor.open_embedding_index(file_path)
+        except Exception:
+            logger.exception("Embedding index build failed for %s", file_id)
+            return None
+
+    def build_document_profile(self, file_id: str, file_path: Path, bm25: BM25Index,
+                               embedding_index: Optional[EmbeddingIndex]):
+        """Store top keywords in the metadata entry and the embedding centroid next to the index"""
+        try:
+            self.file_manager.update_file_metadata(file_id, {'keywords': document_keywords(bm25)})
+            if embedding_index is not None:
+                self.pdf_processor.open_document_centroid(file_path)
+        except Exception:
+            logger.exception("Document profile build failed for %s", file_id)
+
+    def build_summary_tree(self, file_id: str, file_path: Path, store: MappedPageStore):
+        """Summarize the document and embed its summary tree; chunk retrieval still works if this fails"""
+        try:
+            summarizer = get_document_summarizer(self.file_manager.extraction_cache)
+            summarizer.summarize(file_path, store)
+            open_summary_tree(summarizer, file_path)
+        except Exception:
+            logger.exception("Summary tree build failed for %s", file_id)
+
+    def index_in_chromadb(self, file_id: str, store: MappedPageStore, embedding_index: EmbeddingIndex):
+        """Upsert the file's chunk embeddings into the shared vector store"""
+        try:
+            manager = get_chromadb_manager()
+            if manager is not None:
+                manager.upsert_chunks(file_id, embedding_index.matrix,
+                                      store.chunk_page_starts, store.chunk_page_ends)
+                # Library search queries the vector store only for files known to be in it
+                self.file_manager.update_file_metadata(file_id, {'vector_indexed': True})
+        except Exception:
+            logger.exception("ChromaDB indexing failed for %s", file_id)
+
+_pipeline: Optional[IngestionPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_ingestion_pipeline() -> IngestionPipeline:
+    """Return the process-wide ingestion pipeline, shared by every session and rerun"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = IngestionPipeline(FileManager())
+            _pipeline.resume_pending()
+        return _pipeline
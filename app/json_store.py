@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Optimistic attempts before an update falls back to holding the lock for the whole read-modify-write
+CAS_MAX_RETRIES = 5
+
+_thread_locks: dict = {}
+_thread_locks_lock = threading.Lock()
+
+
+def _thread_lock(path: Path) -> threading.Lock:
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(str(path.resolve()), threading.Lock())
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock on a JSON file, held across threads and processes via a sidecar .lock file"""
+    lock_path = path.with_name(path.name + ".lock")
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def file_stamp(path: Path) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime_ns, size) of a file; atomic replaces always change the inode"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def read_json(path: Path, default: Any) -> Any:
+    """Parsed JSON file, or default if it is missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except json.JSONDecodeError:
+        logger.exception("Corrupt JSON file %s", path)
+        return default
+
+
+def fsync_directory(path: Path):
+    """Make renames and new entries in a directory durable"""
+    if not hasattr(os, 'O_DIRECTORY'):  # Windows cannot open a directory for fsync
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_output(path: Path) -> Iterator[Path]:
+    """Temp path to write a file at; on success it is fsynced and renamed over path, otherwise removed"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmp_path
+        fd = os.open(tmp_path, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+        fsync_directory(path.parent)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Write bytes to a temp file, fsync it and rename it over the target, so readers never see a partial file"""
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+
+def atomic_write_json(path: Path, data: Any):
+    """Atomically write a JSON file"""
+    atomic_write_bytes(path, json.dumps(data, indent=2, default=str, ensure_ascii=False).encode('utf-8'))
+
+
+def update_json(path: Path, mutate: Callable[[Any], Any], default: Any,
+                load: Callable[[Path, Any], Any] = read_json,
+                dump: Callable[[Path, Any], None] = atomic_write_json) -> Any:
+    """Read-modify-write a JSON file without losing concurrent updates; returns the data written
+
+    load and dump replace the plain JSON encoding, e.g. for compressed artifacts; dump must
+    replace the file atomically, so the compare-and-swap sees every write.
+    """
+    # mutate gets freshly read data and may run more than once, so it must not have side effects
+    for _ in range(CAS_MAX_RETRIES):
+        stamp = file_stamp(path)
+        data = mutate(load(path, default))
+        with file_lock(path):
+            # Compare-and-swap: only write if nobody replaced the file since it was read
+            if file_stamp(path) == stamp:
+                dump(path, data)
+                return data
+
+    # Heavy contention: hold the lock for the whole cycle so this writer is guaranteed to finish
+    with file_lock(path):
+        data = mutate(load(path, default))
+        dump(path, data)
+        return data
@@ -0,0 +1,211 @@
+import heapq
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.bm25_index import BM25Index
+from app.chromadb_manager import get_chromadb_manager
+from app.document_router import DocumentRouter
+from app.embeddings import EmbeddingIndex, embeddings_available, encode_query
+from app.page_store import MappedPageStore
+from app.pdf_processor import PDFProcessor
+from app.retrieval import HybridRetriever
+
+logger = logging.getLogger(__name__)
+
+LIBRARY_ID = "__library__"
+LIBRARY_DISPLAY_NAME = "All documents"
+# Threads used to query document shards concurrently
+LIBRARY_SEARCH_WORKERS = int(os.environ.get("LIBRARY_SEARCH_WORKERS", 8))
+
+
+class DocumentShard:
+    """One document's slice of the library index; artifacts are shared process-wide"""
+
+    __slots__ = ('file_id', 'filename', 'store', 'bm25', 'embeddings')
+
+    def __init__(self, file_id: str, filename: str, store: MappedPageStore,
+                 bm25: BM25Index, embeddings: Optional[EmbeddingIndex]):
+        self.file_id = file_id
+        self.filename = filename
+        self.store = store
+        self.bm25 = bm25
+        self.embeddings = embeddings
+
+
+class LibraryRetriever:
+    """Hybrid retrieval across every successfully ingested document"""
+
+    def __init__(self, pdf_processor: PDFProcessor, hybrid_retriever: Optional[HybridRetriever] = None,
+                 router: Optional[DocumentRouter] = None, max_workers: int = LIBRARY_SEARCH_WORKERS):
+        self.pdf_processor = pdf_processor
+        self.hybrid_retriever = hybrid_retriever or HybridRetriever()
+        self.router = router or DocumentRouter(pdf_processor)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="library-search")
+
+    def get_shard(self, file_id: str, file_info: Dict) -> Optional[DocumentShard]:
+        """Open a document's shard, or None if its artifacts are unavailable"""
+        content_hash = file_info.get('content_hash')
+        if not content_hash:
+            return None
+        try:
+            # Building artifacts is ingestion's job; a query only uses what is already on disk
+            store = self.pdf_processor.open_cached_page_store(content_hash)
+            bm25 = self.pdf_processor.open_cached_bm25_index(content_hash) if store is not None else None
+            if store is None or bm25 is None:
+                # Requeueing is left to IngestionPipeline.resume_pending; a query must not change file status
+                logger.warning("Skipping %s in library search: its index artifacts are missing", file_id)
+                return None
+            return DocumentShard(
+                file_id,
+                file_info['filename'],
+                store,
+                bm25,
+                self.pdf_processor.open_cached_embedding_index(content_hash)
+            )
+        except Exception:
+            logger.exception("Could not open library shard for %s", file_id)
+            return None
+
+    def search_shard(self, file_id: str, file_info: Dict, question: str, query_vector: Optional[np.ndarray],
+                     brute_force_semantic: bool) -> Tuple[Optional[DocumentShard], List, List]:
+        """Lexical and (unless the vector store covers it) semantic candidates of one shard
+
+        BM25 scores are divided by the query's summed IDF in the shard, so they are comparable across shards.
+        """
+        shard = self.get_shard(file_id, file_info)
+        if shard is None:
+            return None, [], []
+        embeddings = shard.embeddings if brute_force_semantic else None
+        lexical, semantic = self.hybrid_retriever.candidates(question, shard.bm25, embeddings, query_vector)
+        query_weight = shard.bm25.query_weight(question) or 1.0
+        return (
+            shard,
+            [((file_id, chunk_id), score / query_weight) for chunk_id, score in lexical],
+            [((file_id, chunk_id), score) for chunk_id, score in semantic]
+        )
+
+    def vector_store_candidates(self, shards: List[DocumentShard], query_vector: np.ndarray) -> List:
+        """Semantic candidates of several shards from one ANN query, keyed by (file_id, chunk_id)"""
+        pool = self.hybrid_retriever.candidate_pool
+        try:
+            matches = get_chromadb_manager().query(query_vector, n_results=pool,
+                                                   file_ids=[shard.file_id for shard in shards])
+        except Exception:
+            logger.exception("Vector store query failed; scanning the shards' embedding matrices instead")
+            return [((shard.file_id, chunk_id), score) for shard in shards if shard.embeddings is not None
+                    for chunk_id, score in shard.embeddings.search_vector(query_vector, pool)]
+        sizes = {shard.file_id: len(shard.store) for shard in shards}
+        # Records left from an older chunking of a file may point past its current store
+        return [((match['file_id'], match['chunk_id']), match['score']) for match in matches
+                if match['chunk_id'] < sizes.get(match['file_id'], 0)]
+
+    @staticmethod
+    def unique_contents(candidates: List[Tuple[str, Dict]]) -> List[Tuple[str, Dict]]:
+        """One file per stored blob, so duplicate uploads do not return the same chunk twice"""
+        seen = set()
+        unique = []
+        for file_id, file_info in candidates:
+            content_hash = file_info.get('content_hash')
+            if content_hash in seen:
+                continue
+            if content_hash:
+                seen.add(content_hash)
+            unique.append((file_id, file_info))
+        return unique
+
+    def search(self, question: str, metadata: Dict, top_k: int = 5,
+               file_ids: Optional[List[str]] = None, route: bool = True,
+               query_vector: Optional[np.ndarray] = None) -> List[Dict]:
+        """Top-k sources across the library (or a subset of it), each carrying its own filename"""
+        return self.to_sources(self.rank(question, metadata, top_k, file_ids, route, query_vector), metadata)
+
+    def rank(self, question: str, metadata: Dict, top_k: int = 5,
+             file_ids: Optional[List[str]] = None, route: bool = True,
+             query_vector: Optional[np.ndarray] = None) -> List[Tuple[Tuple[str, int], float]]:
+        """Top-k ((file_id, chunk_id), fused score) pairs across the library, best first"""
+        candidates = [
+            (file_id, file_info) for file_id, file_info in metadata.items()
+            if file_info.get('status') == 'success' and (file_ids is None or file_id in file_ids)
+        ]
+        candidates = self.unique_contents(candidates)
+        if not candidates:
+            return []
+
+        # Encode the question once (unless the caller already did) and share the vector across shards
+        if query_vector is None and embeddings_available():
+            query_vector = encode_query(question)
+
+        # Stage one: narrow the library to the documents that best match the question
+        if file_ids is None and route:
+            routed = set(self.router.route(question, candidates, query_vector))
+            candidates = [(file_id, file_info) for file_id, file_info in candidates if file_id in routed]
+
+        # Files already in the vector store are searched with one ANN query instead of a matrix scan each
+        use_vector_store = query_vector is not None and get_chromadb_manager() is not None
+        indexed = {file_id for file_id, file_info in candidates if use_vector_store and file_info.get('vector_indexed')}
+
+        results = self.executor.map(
+            lambda item: self.search_shard(item[0], item[1], question, query_vector, item[0] not in indexed),
+            candidates
+        )
+
+        shards: Dict[str, DocumentShard] = {}
+        lexical: List = []
+        semantic: List = []
+        for shard, shard_lexical, shard_semantic in results:
+            if shard is None:
+                continue
+            shards[shard.file_id] = shard
+            lexical.extend(shard_lexical)
+            semantic.extend(shard_semantic)
+
+        indexed_shards = [shard for file_id, shard in shards.items() if file_id in indexed]
+        if indexed_shards:
+            semantic.extend(self.vector_store_candidates(indexed_shards, query_vector))
+
+        # Normalized BM25 scores and cosine similarities are each comparable across shards,
+        # so every ranker's candidates merge into one library-wide list before fusion
+        pool = self.hybrid_retriever.candidate_pool
+        lexical = heapq.nsmallest(pool, lexical, key=lambda item: (-item[1], item[0]))
+        semantic = heapq.nsmallest(pool, semantic, key=lambda item: (-item[1], item[0]))
+        return self.hybrid_retriever.fuse(
+            [(self.hybrid_retriever.lexical_weight, lexical), (self.hybrid_retriever.semantic_weight, semantic)],
+            top_k
+        )
+
+    def to_sources(self, ranked: List[Tuple[Tuple[str, int], float]], metadata: Dict) -> List[Dict]:
+        """Sources for ranked (file_id, chunk_id) pairs, read from the shared page stores"""
+        stores: Dict[str, Optional[MappedPageStore]] = {}
+        sources = []
+        for (file_id, chunk_id), score in ranked:
+            file_info = metadata.get(file_id)
+            if file_id not in stores:
+                content_hash = file_info.get('content_hash') if file_info else None
+                stores[file_id] = self.pdf_processor.open_cached_page_store(content_hash) if content_hash else None
+            store = stores[file_id]
+            # A file deleted or re-chunked since it was ranked is skipped
+            if store is None or chunk_id >= len(store):
+                continue
+            source = store[chunk_id].to_source()
+            source['file_id'] = file_id
+            source['filename'] = file_info['filename']
+            source['score'] = score
+            sources.append(source)
+        return sources
+
+_library_retriever: Optional[LibraryRetriever] = None
+_library_retriever_lock = threading.Lock()
+
+
+def get_library_retriever() -> LibraryRetriever:
+    """Return the process-wide library retriever"""
+    global _library_retriever
+    with _library_retriever_lock:
+        if _library_retriever is None:
+            _library_retriever = LibraryRetriever(PDFProcessor())
+        return _library_retriever
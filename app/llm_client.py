@@ -0,0 +1,315 @@
+import abc
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# "gemini" for the real API, "fake" for the deterministic offline backend
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini")
+GEMINI_MODEL_NAME = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+# Requests in flight at once across every session; at least 2, so one is always free for interactive questions
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 4))
+# Of those, slots batch work (map-reduce summaries) may hold, so interactive questions always find one free
+LLM_BATCH_MAX_CONCURRENCY = int(os.environ.get("LLM_BATCH_MAX_CONCURRENCY", max(1, LLM_MAX_CONCURRENCY // 2)))
+# Deadline for a whole call, retries and backoff included
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 60))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 4))
+LLM_BACKOFF_BASE_SECONDS = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", 1.0))
+FAKE_LLM_LATENCY_SECONDS = float(os.environ.get("FAKE_LLM_LATENCY_SECONDS", 0.5))
+FAKE_LLM_TOKEN_INTERVAL_SECONDS = float(os.environ.get("FAKE_LLM_TOKEN_INTERVAL_SECONDS", 0.02))
+
+_STREAM_END = object()
+
+
+class LLMProvider(abc.ABC):
+    """Backend interface: one prompt in, text (or streamed text pieces) out"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def generate(self, prompt: str) -> str:
+        """Full answer text for one prompt"""
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # Providers without native streaming deliver the answer as one piece
+        yield await self.generate(prompt)
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Whether an error is a rate limit or transient overload worth retrying"""
+        return False
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through one shared GenerativeModel, so its channel is reused across calls"""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = GEMINI_MODEL_NAME):
+        from app.gemini_helper import create_gemini_model
+        self.model = create_gemini_model(model_name)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            # The final chunk may only carry finish metadata
+            if chunk.parts:
+                yield chunk.text
+
+    def is_retryable(self, error: Exception) -> bool:
+        from google.api_core import exceptions
+        return isinstance(error, (exceptions.ResourceExhausted, exceptions.TooManyRequests,
+                                  exceptions.ServiceUnavailable))
+
+
+class FakeProvider(LLMProvider):
+    """Deterministic offline backend with configurable latency, for load tests without the API"""
+
+    name = "fake"
+
+    def __init__(self, latency_seconds: float = FAKE_LLM_LATENCY_SECONDS,
+                 token_interval_seconds: float = FAKE_LLM_TOKEN_INTERVAL_SECONDS):
+        self.latency_seconds = latency_seconds
+        self.token_interval_seconds = token_interval_seconds
+
+    @staticmethod
+    def answer_for(prompt: str) -> str:
+        """The same prompt always yields the same answer"""
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        return f"Fake answer {digest} for a prompt of {len(prompt.split())} words."
+
+    async def generate(self, prompt: str) -> str:
+        await asyncio.sleep(self.latency_seconds)
+        return self.answer_for(prompt)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency_seconds)
+        for word in self.answer_for(prompt).split(" "):
+            yield word + " "
+            await asyncio.sleep(self.token_interval_seconds)
+
+
+class LLMClient:
+    """Bounded-concurrency LLM calls with deadlines and exponential backoff, run on one background event loop"""
+
+    def __init__(self, provider: LLMProvider, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout_seconds: float = LLM_TIMEOUT_SECONDS, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base_seconds: float = LLM_BACKOFF_BASE_SECONDS,
+                 batch_max_concurrency: int = LLM_BATCH_MAX_CONCURRENCY):
+        if max_concurrency < 2:
+            # With one slot, batch work could hold it and starve interactive questions
+            raise ValueError("max_concurrency must be at least 2")
+        self.provider = provider
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+
+        # Streamlit runs each session on its own thread; every call is funnelled into this loop
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-client", daemon=True)
+        self.thread.start()
+        self.semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(max_concurrency), self.loop).result()
+        # Batch calls take a batch slot before a shared one and always leave at least one shared slot free
+        batch_slots = max(1, min(batch_max_concurrency, max_concurrency - 1))
+        self.batch_semaphore = asyncio.run_coroutine_threadsafe(self._make_semaphore(batch_slots), self.loop).result()
+
+    @staticmethod
+    async def _make_semaphore(max_concurrency: int) -> asyncio.Semaphore:
+        return asyncio.Semaphore(max_concurrency)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, self.backoff_base_seconds * (2 ** attempt))
+
+    @asynccontextmanager
+    async def slot(self, deadline: float):
+        """Hold one shared request slot; time spent waiting for it counts against the deadline"""
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), max(deadline - self.loop.time(), 0))
+        except asyncio.TimeoutError:
+            raise TimeoutError("LLM call exceeded its deadline waiting for a free slot") from None
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+    def wait(self, future: concurrent.futures.Future, timeout: float):
+        """Block the calling thread for a loop result, never past the call's deadline"""
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError("LLM call exceeded its deadline") from None
+
+    async def _with_retries(self, call, deadline: float):
+        """Await call(), retrying rate limits with backoff until the deadline; caller holds the semaphore"""
+        attempt = 0
+        while True:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                raise TimeoutError("LLM call exceeded its deadline")
+            try:
+                return await asyncio.wait_for(call(), remaining)
+            except asyncio.TimeoutError:
+                raise TimeoutError("LLM call exceeded its deadline") from None
+            except Exception as e:
+                if attempt >= self.max_retries or not self.provider.is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt)
+                if self.loop.time() + delay >= deadline:
+                    raise
+                logger.warning("LLM call rate limited (%s); retrying in %.1fs", e, delay)
+                attempt += 1
+                # The slot is kept while backing off, so a rate-limited backend sees less load
+                await asyncio.sleep(delay)
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        # The deadline covers waiting for a slot, the call and its retries
+        deadline = self.loop.time() + (self.timeout_seconds if timeout is None else timeout)
+        async with self.slot(deadline):
+            return await self._with_retries(lambda: self.provider.generate(prompt), deadline)
+
+    async def abatch_generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        async with self.batch_semaphore:
+            # Queueing behind the rest of its own batch is not held against a prompt's deadline
+            return await self.agenerate(prompt, timeout)
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Blocking call from any thread; raises TimeoutError past the deadline"""
+        timeout = self.timeout_seconds if timeout is None else timeout
+        return self.wait(asyncio.run_coroutine_threadsafe(self.agenerate(prompt, timeout), self.loop), timeout)
+
+    def generate_many(self, prompts: List[str], timeout: Optional[float] = None,
+                      total_timeout: Optional[float] = None) -> List[str]:
+        """Run many prompts as low-priority batch work; results keep the prompts' order"""
+        results: List[Optional[str]] = [None] * len(prompts)
+        for index, result in self.iter_generate_many(prompts, timeout, total_timeout):
+            if isinstance(result, Exception):
+                raise result
+            results[index] = result
+        return results
+
+    def iter_generate_many(self, prompts: List[str], timeout: Optional[float] = None,
+                           total_timeout: Optional[float] = None) -> Iterator[Tuple[int, Union[str, Exception]]]:
+        """Yield (prompt index, text or error) as batch prompts finish, in completion order
+
+        A failed prompt does not stop the others. Past total_timeout the prompts still
+        pending are cancelled and TimeoutError is raised.
+        """
+        futures = {
+            asyncio.run_coroutine_threadsafe(self.abatch_generate(prompt, timeout), self.loop): index
+            for index, prompt in enumerate(prompts)
+        }
+        try:
+            for future in concurrent.futures.as_completed(futures, total_timeout):
+                error = future.exception()
+                yield futures[future], error if error is not None else future.result()
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError("LLM batch exceeded its deadline") from None
+        finally:
+            # A deadline or a consumer that stops early must not leave queued prompts holding batch slots
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    async def _close_stream(stream: Optional[AsyncIterator[str]]):
+        """Finalize a provider's stream so it releases its connection"""
+        aclose = getattr(stream, 'aclose', None)
+        if aclose is None:
+            return
+        try:
+            await aclose()
+        except Exception:
+            logger.debug("Closing an LLM stream failed", exc_info=True)
+
+    async def _pump_stream(self, prompt: str, pieces: queue.Queue, timeout: float):
+        """Push streamed pieces into a thread-safe queue; retries only happen before the first piece"""
+        stream = None
+
+        async def first_piece():
+            nonlocal stream
+            # A failed attempt's stream is closed before the retry opens a new one
+            await self._close_stream(stream)
+            stream = self.provider.stream(prompt).__aiter__()
+            try:
+                return await stream.__anext__()
+            except StopAsyncIteration:
+                return _STREAM_END
+
+        try:
+            deadline = self.loop.time() + timeout
+            async with self.slot(deadline):
+                piece = await self._with_retries(first_piece, deadline)
+                while piece is not _STREAM_END:
+                    pieces.put(piece)
+                    remaining = deadline - self.loop.time()
+                    if remaining <= 0:
+                        raise TimeoutError("LLM stream exceeded its deadline")
+                    try:
+                        piece = await asyncio.wait_for(stream.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        piece = _STREAM_END
+                    except asyncio.TimeoutError:
+                        raise TimeoutError("LLM stream exceeded its deadline") from None
+        except Exception as e:
+            # Cancellation is not caught: the consumer that stopped reading is no longer waiting for it
+            pieces.put(e)
+            return
+        finally:
+            await self._close_stream(stream)
+        pieces.put(_STREAM_END)
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        """Blocking iterator of text pieces as the model produces them"""
+        timeout = self.timeout_seconds if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        pieces: queue.Queue = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._pump_stream(prompt, pieces, timeout), self.loop)
+        try:
+            while True:
+                try:
+                    piece = pieces.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    raise TimeoutError("LLM stream exceeded its deadline") from None
+                if piece is _STREAM_END:
+                    return
+                if isinstance(piece, BaseException):
+                    raise piece
+                yield piece
+        finally:
+            # A consumer that stops early (a Streamlit rerun or stop) must not keep holding its slot
+            future.cancel()
+
+
+def create_provider(name: str = LLM_PROVIDER) -> LLMProvider:
+    """Provider instance for a configured backend name"""
+    if name == FakeProvider.name:
+        return FakeProvider()
+    if name == GeminiProvider.name:
+        return GeminiProvider()
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Return the process-wide LLM client, shared by every session and rerun"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(create_provider())
+        return _client
@@ -0,0 +1,286 @@
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fields stored as their own columns; anything else lives in the JSON 'extra' column
+COLUMNS = ('file_id', 'filename', 'filesize', 'created_at', 'status', 'content_hash')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    filesize INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT,
+    status TEXT,
+    content_hash TEXT,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+CREATE TABLE IF NOT EXISTS store_info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _to_text(value) -> Optional[str]:
+    # Matches what json.dump(default=str) wrote for datetimes in the JSON metadata file
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+class SQLiteMetadataStore:
+    """File metadata in SQLite (WAL mode) with indexed lookups and single-row updates"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        # sqlite3 connections must not be shared across threads; Streamlit runs each session on its own
+        self._local = threading.local()
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            # Databases created before content-addressed uploads lack the column
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(files)")}
+            if 'content_hash' not in columns:
+                conn.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS files_content_hash ON files (content_hash)")
+            # Nothing looks files up by name; the index only slowed every write
+            conn.execute("DROP INDEX IF EXISTS files_filename")
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # Readers never block the writer and vice versa
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def row_to_entry(row: sqlite3.Row) -> Dict:
+        entry = {column: row[column] for column in COLUMNS}
+        entry.update(json.loads(row['extra']))
+        return entry
+
+    @staticmethod
+    def entry_to_row(file_id: str, entry: Dict) -> tuple:
+        extra = {key: value for key, value in entry.items() if key not in COLUMNS}
+        return (
+            file_id,
+            entry.get('filename', ''),
+            int(entry.get('filesize') or 0),
+            _to_text(entry.get('created_at')),
+            entry.get('status'),
+            entry.get('content_hash'),
+            json.dumps(extra, default=str)
+        )
+
+    def all(self) -> Dict[str, Dict]:
+        """Every entry keyed by file id, in insertion order"""
+        rows = self.connection().execute("SELECT * FROM files ORDER BY rowid").fetchall()
+        return {row['file_id']: self.row_to_entry(row) for row in rows}
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        row = self.connection().execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        return self.row_to_entry(row) if row is not None else None
+
+    def find_by_content_hash(self, content_hash: str) -> List[Dict]:
+        rows = self.connection().execute(
+            "SELECT * FROM files WHERE content_hash = ? ORDER BY rowid", (content_hash,)
+        )
+        return [self.row_to_entry(row) for row in rows]
+
+    def find_without_content_hash(self) -> List[Dict]:
+        """Entries written before uploads were content-addressed"""
+        rows = self.connection().execute("SELECT * FROM files WHERE content_hash IS NULL ORDER BY rowid")
+        return [self.row_to_entry(row) for row in rows]
+
+    def count_by_content_hash(self, content_hash: str) -> int:
+        """Number of entries referencing one stored blob"""
+        row = self.connection().execute(
+            "SELECT COUNT(*) AS count FROM files WHERE content_hash = ?", (content_hash,)
+        ).fetchone()
+        return row['count']
+
+    def ids_with_status(self, status: str) -> List[str]:
+        rows = self.connection().execute("SELECT file_id FROM files WHERE status = ? ORDER BY rowid", (status,))
+        return [row['file_id'] for row in rows]
+
+    def totals(self) -> Dict:
+        """File count and total size without loading any entry"""
+        row = self.connection().execute("SELECT COUNT(*) AS count, COALESCE(SUM(filesize), 0) AS size FROM files").fetchone()
+        return {'count': row['count'], 'total_size': row['size']}
+
+    def upsert(self, file_id: str, entry: Dict):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files (file_id, filename, filesize, created_at, status, content_hash, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self.entry_to_row(file_id, entry)
+            )
+        metadata_cache.bump(self.db_path)
+
+    def update(self, file_id: str, updates: Dict) -> bool:
+        """Merge fields into one entry; returns False if the file is unknown"""
+        conn = self.connection()
+        with conn:
+            # BEGIN IMMEDIATE takes the write lock up front, so the read-merge-write is atomic
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            if row is None:
+                return False
+            entry = self.row_to_entry(row)
+            entry.update(updates)
+            conn.execute(
+                "UPDATE files SET filename = ?, filesize = ?, created_at = ?, status = ?, content_hash = ?, extra = ? "
+                "WHERE file_id = ?",
+                self.entry_to_row(file_id, entry)[1:] + (file_id,)
+            )
+        metadata_cache.bump(self.db_path)
+        return True
+
+    def delete(self, file_id: str) -> bool:
+        with self.connection() as conn:
+            deleted = conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,)).rowcount > 0
+        metadata_cache.bump(self.db_path)
+        return deleted
+
+    def replace_all(self, metadata: Dict[str, Dict]):
+        """Make the table match a full metadata dict, as the JSON file's save did"""
+        conn = self.connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            existing = {row['file_id'] for row in conn.execute("SELECT file_id FROM files")}
+            conn.executemany("DELETE FROM files WHERE file_id = ?", [(file_id,) for file_id in existing - set(metadata)])
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (file_id, filename, filesize, created_at, status, content_hash, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self.entry_to_row(file_id, entry) for file_id, entry in metadata.items()]
+            )
+        metadata_cache.bump(self.db_path)
+
+    def migrate_from_json(self, json_path: Path):
+        """Import the legacy JSON metadata file once, then rename it out of the way"""
+        if not json_path.exists():
+            return
+        conn = self.connection()
+        if conn.execute("SELECT value FROM store_info WHERE key = 'migrated_from_json'").fetchone():
+            return
+        try:
+            with open(json_path, 'r') as f:
+                metadata = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            logger.exception("Could not read legacy metadata file %s", json_path)
+            metadata = {}
+
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while this one read the file
+            if conn.execute("SELECT value FROM store_info WHERE key = 'migrated_from_json'").fetchone():
+                return
+            conn.executemany(
+                "INSERT OR IGNORE INTO files (file_id, filename, filesize, created_at, status, content_hash, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self.entry_to_row(file_id, entry) for file_id, entry in metadata.items()]
+            )
+            conn.execute(
+                "INSERT INTO store_info (key, value) VALUES ('migrated_from_json', ?)",
+                (datetime.datetime.now().isoformat(),)
+            )
+        metadata_cache.bump(self.db_path)
+        json_path.replace(json_path.with_name(json_path.name + ".migrated"))
+        logger.info("Migrated %d metadata entries from %s", len(metadata), json_path)
+
+
+def freeze(value):
+    """Read-only copy of a parsed JSON value: dicts become mapping proxies, lists become tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class MetadataCache:
+    """Process-wide parsed copy of each store's metadata, shared by all sessions as read-only views"""
+
+    def __init__(self):
+        self._entries: Dict[Path, Tuple[Tuple, int, Mapping[str, Mapping]]] = {}
+        self._versions: Dict[Path, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # A cached copy stays valid while the database and WAL keep their mtime and size
+    # and no write went through this process
+    @staticmethod
+    def file_stamp(db_path: Path) -> Tuple:
+        """(mtime_ns, size) of the database and its WAL; commits from any process change it"""
+        stamp = []
+        for path in (db_path, db_path.with_name(db_path.name + "-wal")):
+            try:
+                stat = path.stat()
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def bump(self, db_path: Path):
+        """Invalidate after a write made by this process"""
+        with self._lock:
+            self._versions[db_path] = self._versions.get(db_path, 0) + 1
+
+    def get(self, store: 'SQLiteMetadataStore') -> Mapping[str, Mapping]:
+        """Read-only view of every entry of a store, re-read only when the store has changed"""
+        db_path = store.db_path
+        with self._lock:
+            version = self._versions.get(db_path, 0)
+            stamp = self.file_stamp(db_path)
+            cached = self._entries.get(db_path)
+            if cached is not None and cached[0] == stamp and cached[1] == version:
+                self.hits += 1
+                return cached[2]
+            self.misses += 1
+
+        # Stamp before reading, so a commit that lands mid-read invalidates this copy next time
+        # Frozen all the way down, since every session shares the same objects
+        view = freeze(store.all())
+        with self._lock:
+            if self._versions.get(db_path, 0) == version:
+                self._entries[db_path] = (stamp, version, view)
+        return view
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+metadata_cache = MetadataCache()
+
+_stores: Dict[Path, SQLiteMetadataStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_metadata_store(db_path: Path) -> SQLiteMetadataStore:
+    """Return the process-wide store for a database, so its schema is checked once per process"""
+    db_path = db_path.resolve()
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = SQLiteMetadataStore(db_path)
+            _stores[db_path] = store
+        return store
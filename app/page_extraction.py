@@ -0,0 +1,36 @@
+import fitz
+from typing import List, Dict, Iterator
+
+
+# Kept free of Streamlit and app imports so spawned worker processes start quickly
+
+def extract_page_range(pdf_path: str, start: int, stop: int) -> List[Dict]:
+    """Extract pages [start, stop) from a PDF using a document handle owned by this process"""
+    return list(iter_page_range(pdf_path, start, stop))
+
+
+def iter_page_range(pdf_path: str, start: int, stop: int) -> Iterator[Dict]:
+    """Yield pages [start, stop) one at a time, keeping only the current page in memory"""
+    doc = fitz.open(pdf_path)
+    try:
+        for page_num in range(start, stop):
+            page = doc.load_page(page_num)
+            yield {
+                'page_number': page_num + 1,
+                'content': page.get_text().strip()
+            }
+    finally:
+        doc.close()
+
+
+def split_page_range(page_count: int, parts: int) -> List[range]:
+    """Split [0, page_count) into at most `parts` contiguous, near-equal ranges"""
+    parts = max(1, min(parts, page_count))
+    size, remainder = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        stop = start + size + (1 if i < remainder else 0)
+        ranges.append(range(start, stop))
+        start = stop
+    return ranges
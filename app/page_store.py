@@ -0,0 +1,253 @@
+import json
+import mmap
+import os
+import threading
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator
+from app.chunker import PAGE_SEPARATOR, ChunkSpan, OffsetChunker
+from app.artifact_registry import ArtifactRegistry
+from app.json_store import atomic_output, atomic_write_bytes
+
+
+class ChunkView:
+    """Lightweight view of one chunk; text is sliced from the store on access"""
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store: 'MappedPageStore', index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def chunk_id(self) -> int:
+        return self.index
+
+    @property
+    def start(self) -> int:
+        return self.store.chunk_starts[self.index]
+
+    @property
+    def end(self) -> int:
+        return self.store.chunk_ends[self.index]
+
+    @property
+    def page_number(self) -> int:
+        return self.store.chunk_page_starts[self.index]
+
+    @property
+    def page_end(self) -> int:
+        return self.store.chunk_page_ends[self.index]
+
+    @property
+    def content(self) -> str:
+        return self.store.chunk_text(self.index)
+
+    def to_source(self) -> Dict:
+        """Source dict in the shape used by chat history and threads"""
+        return {
+            'chunk_id': self.index,
+            'page_number': self.page_number,
+            'page_end': self.page_end,
+            'content': self.content
+        }
+
+
+class MappedPageStore:
+    """Read-only page and chunk store over a memory-mapped UTF-8 text file
+
+    Offsets are byte offsets into the mapped file. Chunks are served as ChunkViews,
+    which slice their text from the mapping only when it is read. close() releases the
+    mapping and its file descriptor; a closed store maps the file again on next access.
+    """
+
+    TEXT_NAME = "pagestore.bin"
+    # Page layout of the text file, shared by every chunker configuration
+    PAGES_NAME = "pagestore_pages.idx"
+
+    def __init__(self, text_path: Path, index_path: Path):
+        self.text_path = text_path
+        self.index_path = index_path
+
+        with open(index_path, 'rb') as f:
+            index = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        self.page_numbers = array('I', index['page_numbers'])
+        self.page_starts = array('q', index['page_starts'])
+        self.page_ends = array('q', index['page_ends'])
+        self.chunk_starts = array('q', index.get('chunk_starts', ()))
+        self.chunk_ends = array('q', index.get('chunk_ends', ()))
+        self.chunk_page_starts = array('I', index.get('chunk_page_starts', ()))
+        self.chunk_page_ends = array('I', index.get('chunk_page_ends', ()))
+
+        self._mmap = None
+        self._view = None
+        self._lock = threading.Lock()
+        self._map()
+
+    def _map(self) -> memoryview:
+        with open(self.text_path, 'rb') as f:
+            # mmap cannot map an empty file
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else None
+        self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(b'')
+        return self._view
+
+    def _slice(self, start: int, end: int) -> memoryview:
+        with self._lock:
+            view = self._view if self._view is not None else self._map()
+            return view[start:end]
+
+    @staticmethod
+    def index_name(chunker_key: str) -> str:
+        return f"pagestore_{chunker_key}.idx"
+
+    @classmethod
+    def write_pages(cls, directory: Path, chunker_key: str, pages: Iterable[Dict], chunker: OffsetChunker):
+        """Stream pages into the document text file and chunk them as they arrive
+
+        Each page is encoded and appended on its own, so neither the joined text nor its
+        UTF-8 copy is ever held in memory. If another chunker configuration already wrote
+        the text, pages are read back from the mapped file instead of from `pages`.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        text_path = directory / cls.TEXT_NAME
+        pages_path = directory / cls.PAGES_NAME
+        if text_path.exists() and pages_path.exists():
+            # The page layout file has no chunk columns, so this reader only serves pages
+            existing = cls(text_path, pages_path)
+            try:
+                cls._write_index(directory, chunker_key, existing.page_numbers, existing.page_starts,
+                                 existing.page_ends, chunker.iter_page_chunks(existing.iter_pages(), byte_offsets=True))
+            finally:
+                existing.close()
+            return
+
+        page_numbers, page_starts, page_ends = array('I'), array('q'), array('q')
+        separator = PAGE_SEPARATOR.encode('utf-8')
+
+        with atomic_output(text_path) as tmp_path, open(tmp_path, 'wb') as f:
+            def written_pages() -> Iterator[Dict]:
+                for page in pages:
+                    if page_numbers:
+                        f.write(separator)
+                    page_starts.append(f.tell())
+                    f.write(page['content'].encode('utf-8'))
+                    page_ends.append(f.tell())
+                    page_numbers.append(page['page_number'])
+                    yield page
+
+            spans = list(chunker.iter_page_chunks(written_pages(), byte_offsets=True))
+
+        # Text first, indexes last: a reader only trusts the text once an index exists
+        atomic_write_bytes(pages_path, cls._compress({
+            'page_numbers': page_numbers.tolist(),
+            'page_starts': page_starts.tolist(),
+            'page_ends': page_ends.tolist()
+        }))
+        cls._write_index(directory, chunker_key, page_numbers, page_starts, page_ends, spans)
+
+    @classmethod
+    def _write_index(cls, directory: Path, chunker_key: str, page_numbers: array, page_starts: array,
+                     page_ends: array, spans: Iterable[ChunkSpan]):
+        """Write the byte-offset index for one chunker configuration"""
+        chunk_starts, chunk_ends, chunk_page_starts, chunk_page_ends = array('q'), array('q'), array('I'), array('I')
+        for span in spans:
+            chunk_starts.append(span.start)
+            chunk_ends.append(span.end)
+            chunk_page_starts.append(span.page_start)
+            chunk_page_ends.append(span.page_end)
+
+        atomic_write_bytes(directory / cls.index_name(chunker_key), cls._compress({
+            'page_numbers': page_numbers.tolist(),
+            'page_starts': page_starts.tolist(),
+            'page_ends': page_ends.tolist(),
+            'chunk_starts': chunk_starts.tolist(),
+            'chunk_ends': chunk_ends.tolist(),
+            'chunk_page_starts': chunk_page_starts.tolist(),
+            'chunk_page_ends': chunk_page_ends.tolist()
+        }))
+
+    @staticmethod
+    def _compress(index: Dict) -> bytes:
+        return zlib.compress(json.dumps(index, separators=(',', ':')).encode('utf-8'), 1)
+
+    @classmethod
+    def exists(cls, directory: Path, chunker_key: str) -> bool:
+        return (directory / cls.TEXT_NAME).exists() and (directory / cls.index_name(chunker_key)).exists()
+
+    def close(self):
+        with self._lock:
+            view, mapping = self._view, self._mmap
+            self._view = self._mmap = None
+        if view is not None:
+            view.release()
+        if mapping is not None:
+            try:
+                mapping.close()
+            except BufferError:
+                # A reader still holds a slice; the mapping is unmapped when that slice is freed
+                pass
+
+    def __len__(self) -> int:
+        return len(self.chunk_starts)
+
+    def __getitem__(self, index: int) -> ChunkView:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return ChunkView(self, index)
+
+    def __iter__(self) -> Iterator[ChunkView]:
+        for index in range(len(self)):
+            yield ChunkView(self, index)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_numbers)
+
+    def chunk_bytes(self, index: int) -> memoryview:
+        """Zero-copy view of one chunk's UTF-8 bytes"""
+        return self._slice(self.chunk_starts[index], self.chunk_ends[index])
+
+    def chunk_text(self, index: int) -> str:
+        """Text of one chunk"""
+        return str(self.chunk_bytes(index), 'utf-8')
+
+    def iter_chunk_texts(self) -> Iterator[str]:
+        """Texts of all chunks in order"""
+        for index in range(len(self)):
+            yield self.chunk_text(index)
+
+    def page_bytes_at(self, index: int) -> memoryview:
+        """Zero-copy view of one page's UTF-8 bytes by position in the document"""
+        return self._slice(self.page_starts[index], self.page_ends[index])
+
+    def page_text_at(self, index: int) -> str:
+        """Text of one page by position in the document"""
+        return str(self.page_bytes_at(index), 'utf-8')
+
+    def iter_pages(self) -> Iterator[Dict]:
+        """Page dicts in document order, decoding one page at a time"""
+        for index, page_number in enumerate(self.page_numbers):
+            yield {'page_number': page_number, 'content': self.page_text_at(index)}
+
+    def page_text(self, page_number: int) -> str:
+        """Text of one page by page number"""
+        return self.page_text_at(self.page_numbers.index(page_number))
+
+
+_open_stores: ArtifactRegistry[MappedPageStore] = ArtifactRegistry(close=MappedPageStore.close)
+
+
+def open_page_store(directory: Path, chunker_key: str) -> MappedPageStore:
+    """Return a process-wide shared reader, so sessions reuse one mapping of each document"""
+    index_path = directory / MappedPageStore.index_name(chunker_key)
+    with _open_stores.lock:
+        store = _open_stores.get(index_path)
+        if store is not None and not index_path.exists():
+            # Artifacts were invalidated; drop the stale mapping
+            _open_stores.discard(index_path)
+            store = None
+        if store is None:
+            store = MappedPageStore(directory / MappedPageStore.TEXT_NAME, index_path)
+            _open_stores.put(index_path, store)
+        return store
@@ -1,11 +1,54 @@
-import streamlit as st
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 import fitz  
-from typing import List, Dict, Tuple, Optional
+import numpy as np
+from typing import Dict, Optional, Iterator
 from app.file_manager import FileManager
+from app.chunker import OffsetChunker
+from app.page_store import MappedPageStore, open_page_store
+from app.bm25_index import BM25Index, open_bm25_index
+from app.embeddings import EmbeddingIndex, embeddings_available, open_document_centroid, open_embedding_index
+from app.json_store import atomic_output
+from app.page_extraction import extract_page_range, iter_page_range, split_page_range
 from app.chat_sidebar import ChatSidebar
 from app.chat_memory import ChatMemoryManager
 
+# Documents with fewer pages than this are extracted serially; pool startup would dominate
+PARALLEL_PAGE_THRESHOLD = int(os.environ.get("PDF_PARALLEL_PAGE_THRESHOLD", 150))
+# Worker processes used for parallel extraction (1 disables it)
+PARALLEL_MAX_WORKERS = int(os.environ.get("PDF_PARALLEL_MAX_WORKERS", min(4, os.cpu_count() or 1)))
+
+logger = logging.getLogger(__name__)
+
+_extraction_pools: Dict[int, ProcessPoolExecutor] = {}
+_extraction_pools_lock = threading.Lock()
+
+
+def get_extraction_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Return a process pool shared by all sessions, so worker startup is paid once per server"""
+    with _extraction_pools_lock:
+        pool = _extraction_pools.get(max_workers)
+        if pool is None:
+            # Spawn rather than fork: the Streamlit server is multi-threaded
+            pool = ProcessPoolExecutor(max_workers=max_workers,
+                                       mp_context=multiprocessing.get_context("spawn"))
+            _extraction_pools[max_workers] = pool
+        return pool
+
+
+def discard_extraction_pool(max_workers: int, pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next extraction starts a fresh one"""
+    with _extraction_pools_lock:
+        # Another session may already have replaced it
+        if _extraction_pools.get(max_workers) is pool:
+            del _extraction_pools[max_workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
 
 class PDFProcessor:
     """Class for PDF processing and text extraction"""
@@ -15,70 +58,142 @@ class PDFProcessor:
         self.chat_sidebar = ChatSidebar(self.file_manager,self.chat_memory)
         # self.chat_ui = ChatWithPDFUI(self.file_manager, self.chat_sidebar)
         # self.pdf_processor = PDFProcessor()
+
+    def has_artifacts(self, content_hash: str, chunker: Optional[OffsetChunker] = None) -> bool:
+        """Whether ingestion's page store and BM25 index exist for a file content"""
+        chunker = chunker or OffsetChunker()
+        cache = self.file_manager.extraction_cache
+        return (MappedPageStore.exists(cache.artifact_dir(content_hash), chunker.cache_key)
+                and cache.artifact_path(content_hash, BM25Index.index_name(chunker.cache_key)).exists())
+
+    def open_page_store(self, pdf_path: Path, chunker: Optional[OffsetChunker] = None,
+                        build: bool = True) -> Optional[MappedPageStore]:
+        """Return the shared memory-mapped page store for a PDF, writing it on first use unless build is False"""
+        chunker = chunker or OffsetChunker()
+        cache = self.file_manager.extraction_cache
+        directory = cache.artifact_dir(cache.compute_content_hash(pdf_path))
+
+        if not MappedPageStore.exists(directory, chunker.cache_key):
+            if not build:
+                return None
+            MappedPageStore.write_pages(directory, chunker.cache_key, self.iter_pages(pdf_path), chunker)
+        return open_page_store(directory, chunker.cache_key)
+
+    def open_bm25_index(self, pdf_path: Path, chunker: Optional[OffsetChunker] = None,
+                        build: bool = True) -> Optional[BM25Index]:
+        """Return the shared BM25 index over a PDF's chunks, building it on first use unless build is False"""
+        chunker = chunker or OffsetChunker()
+        cache = self.file_manager.extraction_cache
+        index_path = cache.artifact_path(cache.compute_content_hash(pdf_path), BM25Index.index_name(chunker.cache_key))
+
+        if not index_path.exists():
+            if not build:
+                return None
+            store = self.open_page_store(pdf_path, chunker)
+            BM25Index.build(store.iter_chunk_texts()).save(index_path)
+        return open_bm25_index(index_path)
+
+    def open_embedding_index(self, pdf_path: Path, chunker: Optional[OffsetChunker] = None,
+                             build: bool = True) -> Optional[EmbeddingIndex]:
+        """Return the shared chunk embedding matrix for a PDF, or None if embeddings are unavailable"""
+        if not embeddings_available():
+            return None
+        chunker = chunker or OffsetChunker()
+        cache = self.file_manager.extraction_cache
+        index_path = cache.artifact_path(cache.compute_content_hash(pdf_path), EmbeddingIndex.index_name(chunker.cache_key))
+
+        if not index_path.exists() and build:
+            store = self.open_page_store(pdf_path, chunker)
+            EmbeddingIndex.build(index_path, store.iter_chunk_texts(), len(store))
+        return open_embedding_index(index_path)
+
+    def open_document_centroid(self, pdf_path: Path, chunker: Optional[OffsetChunker] = None,
+                               build: bool = True) -> Optional[np.ndarray]:
+        """Document-level embedding (normalized mean of chunk embeddings) used for routing, or None"""
+        chunker = chunker or OffsetChunker()
+        cache = self.file_manager.extraction_cache
+        content_hash = cache.compute_content_hash(pdf_path)
+        centroid_path = cache.artifact_path(content_hash, EmbeddingIndex.centroid_name(chunker.cache_key))
+
+        centroid = open_document_centroid(centroid_path)
+        if centroid is None and build:
+            embedding_index = self.open_embedding_index(pdf_path, chunker)
+            if embedding_index is None:
+                return None
+            with atomic_output(centroid_path) as tmp_path, open(tmp_path, 'wb') as f:
+                np.save(f, embedding_index.centroid())
+            centroid = open_document_centroid(centroid_path)
+        return centroid
+
+    def open_cached_page_store(self, content_hash: str,
+                               chunker: Optional[OffsetChunker] = None) -> Optional[MappedPageStore]:
+        """Page store of already-ingested content, or None; needs neither the PDF nor its hash"""
+        chunker = chunker or OffsetChunker()
+        directory = self.file_manager.extraction_cache.artifact_dir(content_hash)
+        if not MappedPageStore.exists(directory, chunker.cache_key):
+            return None
+        return open_page_store(directory, chunker.cache_key)
+
+    def open_cached_bm25_index(self, content_hash: str,
+                               chunker: Optional[OffsetChunker] = None) -> Optional[BM25Index]:
+        """BM25 index of already-ingested content, or None"""
+        chunker = chunker or OffsetChunker()
+        index_path = self.file_manager.extraction_cache.artifact_path(content_hash, BM25Index.index_name(chunker.cache_key))
+        return open_bm25_index(index_path) if index_path.exists() else None
+
+    def open_cached_embedding_index(self, content_hash: str,
+                                    chunker: Optional[OffsetChunker] = None) -> Optional[EmbeddingIndex]:
+        """Chunk embedding matrix of already-ingested content, or None"""
+        if not embeddings_available():
+            return None
+        chunker = chunker or OffsetChunker()
+        cache = self.file_manager.extraction_cache
+        return open_embedding_index(cache.artifact_path(content_hash, EmbeddingIndex.index_name(chunker.cache_key)))
+
+    def open_cached_document_centroid(self, content_hash: str,
+                                      chunker: Optional[OffsetChunker] = None) -> Optional[np.ndarray]:
+        """Document centroid of already-ingested content, or None"""
+        chunker = chunker or OffsetChunker()
+        cache = self.file_manager.extraction_cache
+        return open_document_centroid(cache.artifact_path(content_hash, EmbeddingIndex.centroid_name(chunker.cache_key)))
+
     @staticmethod
-    def extract_text_with_pages(pdf_path: Path) -> List[Dict]:
-        """Extract text from PDF with page information"""
-        try:
-            doc = fitz.open(pdf_path)
-            pages_content = []
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text()
-                pages_content.append({
-                    'page_number': page_num + 1,
-                    'content': text.strip()
-                })
-            
-            doc.close()
-            return pages_content
-        except Exception as e:
-            st.error(f"Error processing PDF: {str(e)}")
-            return []
-    
+    def iter_pages(pdf_path: Path, max_workers: Optional[int] = None,
+                   parallel_threshold: Optional[int] = None) -> Iterator[Dict]:
+        """Yield page dicts in page order as they are extracted; errors propagate to the caller"""
+        max_workers = PARALLEL_MAX_WORKERS if max_workers is None else max_workers
+        parallel_threshold = PARALLEL_PAGE_THRESHOLD if parallel_threshold is None else parallel_threshold
+
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+
+        if max_workers > 1 and page_count >= parallel_threshold:
+            yield from PDFProcessor.iter_pages_parallel(pdf_path, page_count, max_workers)
+        else:
+            yield from iter_page_range(str(pdf_path), 0, page_count)
+
     @staticmethod
-    def create_pdf_chunks(pages_content: List[Dict], chunk_size: int = 1000) -> List[Dict]:
-        """Create chunks from PDF content for better processing"""
-        chunks = []
-        chunk_id = 0
-        
-        for page in pages_content:
-            content = page['content']
-            page_num = page['page_number']
-            
-            if len(content) <= chunk_size:
-                chunks.append({
-                    'chunk_id': chunk_id,
-                    'page_number': page_num,
-                    'content': content
-                })
-                chunk_id += 1
-            else:
-                # Split large pages into smaller chunks
-                words = content.split()
-                current_chunk = []
-                current_length = 0
-                
-                for word in words:
-                    if current_length + len(word) > chunk_size and current_chunk:
-                        chunks.append({
-                            'chunk_id': chunk_id,
-                            'page_number': page_num,
-                            'content': ' '.join(current_chunk)
-                        })
-                        chunk_id += 1
-                        current_chunk = [word]
-                        current_length = len(word)
-                    else:
-                        current_chunk.append(word)
-                        current_length += len(word) + 1
-                
-                if current_chunk:
-                    chunks.append({
-                        'chunk_id': chunk_id,
-                        'page_number': page_num,
-                        'content': ' '.join(current_chunk)
-                    })
-                    chunk_id += 1
-        
-        return chunks
\ No newline at end of file
+    def iter_pages_parallel(pdf_path: Path, page_count: int, max_workers: int) -> Iterator[Dict]:
+        """Extract pages across a process pool, each worker opening its own document"""
+        # A few ranges per worker keeps workers busy when page complexity is uneven
+        page_ranges = split_page_range(page_count, max_workers * 4)
+
+        pool = get_extraction_pool(max_workers)
+        next_page = 0
+        try:
+            results = pool.map(
+                extract_page_range,
+                [str(pdf_path)] * len(page_ranges),
+                [r.start for r in page_ranges],
+                [r.stop for r in page_ranges]
+            )
+            # map() yields in submission order, so pages come back in page order
+            for page_batch in results:
+                for page in page_batch:
+                    yield page
+                    next_page += 1
+        except BrokenProcessPool:
+            # A worker died (crash, OOM kill); a dead pool would fail every later upload too
+            logger.warning("Extraction pool broke on %s; extracting the remaining pages serially", pdf_path)
+            discard_extraction_pool(max_workers, pool)
+            yield from iter_page_range(str(pdf_path), next_page, page_count)
@@ -0,0 +1,106 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Retrieval results kept in memory, and how long before one is recomputed anyway
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 512))
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get("QUERY_CACHE_TTL_SECONDS", 600))
+
+# Per-document index versions; the None entry is the library-wide generation
+_index_versions: Dict[Optional[str], int] = {}
+_index_versions_lock = threading.Lock()
+
+
+def index_version(file_id: Optional[str] = None) -> int:
+    """Current index version of a document, or of the whole library when file_id is None"""
+    with _index_versions_lock:
+        return _index_versions.get(file_id, 0)
+
+
+def bump_index_version(file_id: str):
+    """Invalidate cached results for a document (and the library) after re-ingestion or deletion"""
+    with _index_versions_lock:
+        _index_versions[file_id] = _index_versions.get(file_id, 0) + 1
+        _index_versions[None] = _index_versions.get(None, 0) + 1
+
+
+def normalize_question(question: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question"""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+
+class QueryResultCache:
+    """Thread-safe LRU cache of retrieval results with a time-to-live
+
+    Results are ranked (reference, score) pairs; callers read the text behind a reference
+    from the shared page stores, so entries never hold copies of chunk content.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl_seconds: float = QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[Hashable, Tuple[float, List[Tuple[Hashable, float]]]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(question: str, file_id: str, mode: Hashable, version: int) -> Hashable:
+        return (normalize_question(question), file_id, mode, version)
+
+    def get(self, key: Hashable) -> Optional[List[Tuple[Hashable, float]]]:
+        """Cached ranked (reference, score) pairs for a key, or None on a miss or expired entry"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        # Callers get their own list; the pairs themselves are immutable
+        return list(entry[1])
+
+    def put(self, key: Hashable, ranked: List[Tuple[Hashable, float]]):
+        """Store a retrieval result, evicting the least recently used entries beyond the limit"""
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), list(ranked))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size, for sizing the cache"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries
+            }
+
+
+_query_cache: Optional[QueryResultCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryResultCache:
+    """Return the process-wide retrieval result cache, shared by every session and rerun"""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryResultCache()
+        return _query_cache
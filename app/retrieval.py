@@ -0,0 +1,61 @@
+import heapq
+import os
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.bm25_index import BM25Index
+from app.embeddings import EmbeddingIndex
+
+# Reciprocal-rank-fusion damping constant; 60 is the value from the original RRF paper
+RRF_K = int(os.environ.get("HYBRID_RRF_K", 60))
+HYBRID_LEXICAL_WEIGHT = float(os.environ.get("HYBRID_LEXICAL_WEIGHT", 1.0))
+HYBRID_SEMANTIC_WEIGHT = float(os.environ.get("HYBRID_SEMANTIC_WEIGHT", 1.0))
+# How many candidates each ranker contributes before fusion
+HYBRID_CANDIDATE_POOL = int(os.environ.get("HYBRID_CANDIDATE_POOL", 50))
+
+
+def top_k_items(scores: Dict[Hashable, float], top_k: int) -> List[Tuple[Hashable, float]]:
+    """Top-k (id, score) pairs by heap selection, best first; ties go to the lower id"""
+    return heapq.nsmallest(top_k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class HybridRetriever:
+    """Fuses BM25 and embedding rankings with weighted reciprocal-rank fusion"""
+
+    def __init__(self, lexical_weight: float = HYBRID_LEXICAL_WEIGHT,
+                 semantic_weight: float = HYBRID_SEMANTIC_WEIGHT,
+                 rrf_k: int = RRF_K, candidate_pool: int = HYBRID_CANDIDATE_POOL):
+        self.lexical_weight = lexical_weight
+        self.semantic_weight = semantic_weight
+        self.rrf_k = rrf_k
+        self.candidate_pool = candidate_pool
+
+    def fuse(self, rankings: Sequence[Tuple[float, List[Tuple[Hashable, float]]]],
+             top_k: int) -> List[Tuple[Hashable, float]]:
+        """Combine (weight, ranked results) lists into one top-k list of (id, fused score)"""
+        fused: Dict[Hashable, float] = {}
+        for weight, ranked in rankings:
+            if weight <= 0:
+                continue
+            for rank, (item_id, _) in enumerate(ranked, start=1):
+                fused[item_id] = fused.get(item_id, 0.0) + weight / (self.rrf_k + rank)
+        return top_k_items(fused, top_k)
+
+    def candidates(self, question: str, bm25: BM25Index, embeddings: Optional[EmbeddingIndex],
+                   query_vector: Optional[np.ndarray] = None) -> Tuple[List[Tuple[int, float]], List[Tuple[int, float]]]:
+        """Lexical and semantic candidate lists (best first) for one document"""
+        lexical = bm25.search(question, self.candidate_pool)
+        semantic = []
+        if embeddings is not None:
+            if query_vector is None:
+                semantic = embeddings.search(question, self.candidate_pool)
+            else:
+                semantic = embeddings.search_vector(query_vector, self.candidate_pool)
+        return lexical, semantic
+
+    def search(self, question: str, bm25: BM25Index, embeddings: Optional[EmbeddingIndex],
+               top_k: int = 5, query_vector: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k chunk ids for a question using whichever rankers are available"""
+        lexical, semantic = self.candidates(question, bm25, embeddings, query_vector)
+        return self.fuse([(self.lexical_weight, lexical), (self.semantic_weight, semantic)], top_k)
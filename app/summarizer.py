@@ -0,0 +1,248 @@
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.chunker import count_tokens
+from app.context_packer import truncate_tokens
+from app.extraction_cache import ExtractionCache
+from app.llm_client import LLM_PROVIDER, LLMClient, get_llm_client
+from app.page_store import MappedPageStore
+
+logger = logging.getLogger(__name__)
+
+# Approximate tokens of page text summarized by one map call
+SUMMARY_GROUP_TOKENS = int(os.environ.get("SUMMARY_GROUP_TOKENS", 3000))
+# Summaries combined by one reduce call
+SUMMARY_REDUCE_FAN_IN = int(os.environ.get("SUMMARY_REDUCE_FAN_IN", 8))
+# Deadline for a whole summarization, map and reduce included; finished sections are kept for the next try
+SUMMARY_TIMEOUT_SECONDS = float(os.environ.get("SUMMARY_TIMEOUT_SECONDS", 600))
+# Shorter deadline when a chat question waits for the summary on the Streamlit script thread
+SUMMARY_INTERACTIVE_TIMEOUT_SECONDS = float(os.environ.get("SUMMARY_INTERACTIVE_TIMEOUT_SECONDS", 120))
+
+DOCUMENT_NOUN = r"(document|doc|pdf|book|paper|report|text|file|manual)"
+# Only requests about the document as a whole; "summary" or "overview" alone also name tables,
+# rows and sections, so bare words only count when they are the entire question
+SUMMARY_REQUEST_PATTERN = re.compile(
+    rf"\bwhat('s|\s+is)\s+(this|the)\s+{DOCUMENT_NOUN}\s+about\b"
+    rf"|\bwhat('s|\s+is)\s+(this|it)\s+about\W*$"
+    rf"|\bsummari[sz]e\s+((this|the)\s+((whole|entire)\s+)?{DOCUMENT_NOUN}\b|(it|this)\W*$)"
+    rf"|\b(summary|overview|gist|tl;?dr|main\s+(points|topics|ideas|themes))\s+of\s+(this|the)\s+((whole|entire)\s+)?{DOCUMENT_NOUN}\b"
+    rf"|^((please\s+)?(give|show|write)\s+(me\s+)?(a|an)\s+)?(summary|overview|gist|tl;?dr)\W*$",
+    re.IGNORECASE
+)
+
+
+def is_summary_request(question: str) -> bool:
+    """Whether a question asks about the document as a whole rather than a specific fact"""
+    return SUMMARY_REQUEST_PATTERN.search(question.strip()) is not None
+
+
+class DocumentSummarizer:
+    """Map-reduce summaries of whole documents, cached by content hash"""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, extraction_cache: ExtractionCache, llm_client: Optional[LLMClient] = None,
+                 group_tokens: int = SUMMARY_GROUP_TOKENS, fan_in: int = SUMMARY_REDUCE_FAN_IN):
+        self.extraction_cache = extraction_cache
+        self._llm_client = llm_client
+        self.group_tokens = group_tokens
+        self.fan_in = max(2, fan_in)
+        # One summarization per document at a time; concurrent requests wait for its result
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @property
+    def llm_client(self) -> LLMClient:
+        if self._llm_client is None:
+            self._llm_client = get_llm_client()
+        return self._llm_client
+
+    def summary_name(self) -> str:
+        # Named from configuration so looking up a cached summary never has to start a provider
+        provider = self._llm_client.provider.name if self._llm_client is not None else LLM_PROVIDER
+        return f"summary_v{self.FORMAT_VERSION}_{provider}_g{self.group_tokens}.json.z"
+
+    def sections_name(self) -> str:
+        """Section summaries finished so far, so an interrupted summarization resumes where it stopped"""
+        return self.summary_name().replace("summary_", "summary_sections_", 1)
+
+    def document_lock(self, content_hash: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(content_hash, threading.Lock())
+
+    def page_groups(self, store: MappedPageStore) -> List[Dict]:
+        """Consecutive pages grouped up to the map token budget"""
+        groups: List[Dict] = []
+        parts: List[str] = []
+        tokens = 0
+        first_page = None
+        last_page = None
+        for index in range(store.page_count):
+            text = store.page_text_at(index).strip()
+            if not text:
+                continue
+            page_number = store.page_numbers[index]
+            page_tokens = count_tokens(text)
+            if parts and tokens + page_tokens > self.group_tokens:
+                groups.append({'page_start': first_page, 'page_end': last_page, 'text': "\n\n".join(parts)})
+                parts, tokens, first_page = [], 0, None
+            if first_page is None:
+                first_page = page_number
+            last_page = page_number
+            # A single oversized page is cut to the budget rather than blowing up one prompt
+            parts.append(truncate_tokens(text, self.group_tokens) if page_tokens > self.group_tokens else text)
+            tokens += min(page_tokens, self.group_tokens)
+        if parts:
+            groups.append({'page_start': first_page, 'page_end': last_page, 'text': "\n\n".join(parts)})
+        return groups
+
+    @staticmethod
+    def map_prompt(group: Dict) -> str:
+        return f"""
+        Summarize the following section of a PDF (pages {group['page_start']}-{group['page_end']}).
+        Keep the key facts, arguments, names and numbers. Answer with the summary only.
+
+        Section text:
+        {group['text']}
+        """
+
+    @staticmethod
+    def reduce_prompt(summaries: List[str]) -> str:
+        joined = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(summaries))
+        return f"""
+        The following are summaries of consecutive parts of one PDF document.
+        Combine them into a single coherent summary that covers every part. Answer with the summary only.
+
+        {joined}
+        """
+
+    @staticmethod
+    def section_key(group: Dict) -> str:
+        return f"{group['page_start']}-{group['page_end']}"
+
+    def map_sections(self, content_hash: str, groups: List[Dict], deadline: float) -> List[Dict]:
+        """Summarize every section, saving each summary as it completes
+
+        Raises TimeoutError if the deadline passed with sections missing (the next call resumes),
+        otherwise the first backend error of a failed section.
+        """
+        name = self.sections_name()
+        done: Dict[str, str] = (self.extraction_cache.load_json(content_hash, name) or {}).get('sections', {})
+        pending = [group for group in groups if self.section_key(group) not in done]
+        errors: List[Exception] = []
+        timed_out = False
+        if pending:
+            # Map: every remaining section is summarized by a concurrent model call
+            results = self.llm_client.iter_generate_many(
+                [self.map_prompt(group) for group in pending],
+                total_timeout=max(deadline - time.monotonic(), 0)
+            )
+            try:
+                for index, text in results:
+                    if isinstance(text, Exception):
+                        logger.warning("Summary of pages %s failed: %s", self.section_key(pending[index]), text)
+                        errors.append(text)
+                        continue
+                    done[self.section_key(pending[index])] = text
+                    self.extraction_cache.save_json(content_hash, name, {'sections': done})
+            except TimeoutError:
+                logger.warning("Summarization deadline passed with %d sections left", len(groups) - len(done))
+                timed_out = True
+        missing = sum(1 for group in groups if self.section_key(group) not in done)
+        if missing and timed_out:
+            raise TimeoutError(f"Summarized {len(groups) - missing} of {len(groups)} sections "
+                               f"before the deadline; ask again to resume")
+        if missing:
+            # Not a deadline: retrying at once would most likely fail the same way
+            raise errors[0]
+        return [
+            {'page_start': group['page_start'], 'page_end': group['page_end'], 'summary': done[self.section_key(group)]}
+            for group in groups
+        ]
+
+    def reduce(self, nodes: List[Dict], deadline: Optional[float] = None) -> List[List[Dict]]:
+        """Hierarchically combine summary nodes fan_in at a time; returns every level above the input, top last"""
+        levels: List[List[Dict]] = []
+        while len(nodes) > 1:
+            batches = [nodes[i:i + self.fan_in] for i in range(0, len(nodes), self.fan_in)]
+            # Every batch of a level is reduced by a concurrent model call
+            texts = self.llm_client.generate_many(
+                [self.reduce_prompt([node['summary'] for node in batch]) for batch in batches],
+                total_timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None
+            )
+            nodes = [
+                {'page_start': batch[0]['page_start'], 'page_end': batch[-1]['page_end'], 'summary': text}
+                for batch, text in zip(batches, texts)
+            ]
+            levels.append(nodes)
+        return levels
+
+    def get_cached(self, pdf_path: Path) -> Optional[Dict]:
+        """Stored {'sections', 'document'} summary of a file, or None"""
+        content_hash = self.extraction_cache.compute_content_hash(pdf_path)
+        return self.extraction_cache.load_json(content_hash, self.summary_name())
+
+    @staticmethod
+    def fallback_document(sections: List[Dict]) -> str:
+        """Section summaries in page order, used when they cannot be combined into one"""
+        return "\n\n".join(f"Pages {section['page_start']}-{section['page_end']}: {section['summary']}"
+                           for section in sections)
+
+    def summarize(self, pdf_path: Path, store: MappedPageStore, timeout: float = SUMMARY_TIMEOUT_SECONDS) -> Dict:
+        """Per-section and whole-document summaries, computed once per document content
+
+        Finished section summaries are kept, so after TimeoutError or a backend error the next
+        call resumes. If only the reduce step fails, the section summaries are returned as the
+        document summary without being cached.
+        """
+        deadline = time.monotonic() + timeout
+        content_hash = self.extraction_cache.compute_content_hash(pdf_path)
+        name = self.summary_name()
+        cached = self.extraction_cache.load_json(content_hash, name)
+        if cached is not None:
+            return cached
+
+        lock = self.document_lock(content_hash)
+        if not lock.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise TimeoutError("This document is still being summarized; ask again shortly")
+        try:
+            # Another session may have finished it while this one waited
+            cached = self.extraction_cache.load_json(content_hash, name)
+            if cached is not None:
+                return cached
+
+            sections = self.map_sections(content_hash, self.page_groups(store), deadline)
+            try:
+                levels = self.reduce(sections, deadline)
+            except Exception as e:
+                logger.warning("Combining section summaries of %s failed (%s); returning the sections", pdf_path, e)
+                return {'sections': sections, 'levels': [], 'document': self.fallback_document(sections)}
+            summary = {
+                'sections': sections,
+                # Intermediate reduce levels, kept for the summary tree index
+                'levels': levels[:-1],
+                'document': levels[-1][0]['summary'] if levels else (sections[0]['summary'] if sections else "")
+            }
+            self.extraction_cache.save_json(content_hash, name, summary)
+            self.extraction_cache.artifact_path(content_hash, self.sections_name()).unlink(missing_ok=True)
+            return summary
+        finally:
+            lock.release()
+
+
+_summarizer: Optional[DocumentSummarizer] = None
+_summarizer_lock = threading.Lock()
+
+
+def get_document_summarizer(extraction_cache: ExtractionCache) -> DocumentSummarizer:
+    """Return the process-wide document summarizer"""
+    global _summarizer
+    with _summarizer_lock:
+        if _summarizer is None:
+            _summarizer = DocumentSummarizer(extraction_cache)
+        return _summarizer
@@ -0,0 +1,148 @@
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.artifact_registry import ArtifactRegistry
+from app.embeddings import embeddings_available, encode_query, encode_texts, model_slug
+from app.json_store import atomic_output
+from app.summarizer import DOCUMENT_NOUN, DocumentSummarizer
+
+# Build the summary tree for every upload; off by default because it costs one LLM call per section
+SUMMARY_TREE_AT_INGESTION = os.environ.get("SUMMARY_TREE_AT_INGESTION", "0") == "1"
+# Broad questions are answered from the deepest tree level that has at most this many nodes
+SUMMARY_TREE_MAX_NODES = int(os.environ.get("SUMMARY_TREE_MAX_NODES", 6))
+
+# Only phrasings that are about the document as a whole; single words like "compare" or "sections"
+# appear in ordinary fact questions too
+BROAD_QUESTION_PATTERN = re.compile(
+    rf"\b((throughout|across)\s+the\s+((whole|entire)\s+)?{DOCUMENT_NOUN}"
+    rf"|(the\s+)?(whole|entire)\s+{DOCUMENT_NOUN}"
+    rf"|overall\s+(theme|themes|argument|message|structure|conclusion|picture)"
+    rf"|(main|major|central|recurring|common)\s+themes?"
+    rf"|key\s+(ideas|findings|takeaways|arguments)"
+    rf"|how\s+does\s+the\s+{DOCUMENT_NOUN}\s+(evolve|develop|progress))\b",
+    re.IGNORECASE
+)
+
+
+def is_broad_question(question: str) -> bool:
+    """Whether a question spans many pages rather than asking for one fact"""
+    return BROAD_QUESTION_PATTERN.search(question) is not None
+
+
+class SummaryTree:
+    """Section, intermediate and document summaries of one PDF, each node embedded when possible"""
+
+    def __init__(self, nodes: List[Dict], matrix: Optional[np.ndarray]):
+        self.nodes = nodes
+        self.matrix = matrix
+        self.top_level = max((node['level'] for node in nodes), default=0)
+
+    @staticmethod
+    def nodes_from_summary(summary: Dict) -> List[Dict]:
+        """Flatten a DocumentSummarizer result into nodes; level 1 is sections, the top level is the document"""
+        levels = [summary['sections']] + summary.get('levels', [])
+        nodes = [
+            dict(node, level=level, node_id=f"L{level}:{index}")
+            for level, level_nodes in enumerate(levels, start=1)
+            for index, node in enumerate(level_nodes)
+        ]
+        if summary['sections']:
+            nodes.append({
+                'level': len(levels) + 1,
+                'node_id': f"L{len(levels) + 1}:0",
+                'page_start': summary['sections'][0]['page_start'],
+                'page_end': summary['sections'][-1]['page_end'],
+                'summary': summary['document']
+            })
+        return nodes
+
+    def level_indices(self, level: int) -> List[int]:
+        return [i for i, node in enumerate(self.nodes) if node['level'] == level]
+
+    def choose_level(self, question: str) -> Optional[int]:
+        """Tree level that answers a question, or None when raw chunks suit it better"""
+        # Whole-document summary requests never get here; the chat answers them from the summary itself
+        if not self.nodes:
+            return None
+        if is_broad_question(question):
+            # Deepest level that still covers the whole document in a handful of nodes
+            for level in range(1, self.top_level + 1):
+                if len(self.level_indices(level)) <= SUMMARY_TREE_MAX_NODES:
+                    return level
+            return self.top_level
+        return None
+
+    def search(self, question: str, level: int, query_vector: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Nodes of one level as (node index, similarity), most similar first; page order without embeddings"""
+        indices = self.level_indices(level)
+        if self.matrix is None or not embeddings_available():
+            return [(i, 0.0) for i in indices]
+        if query_vector is None:
+            query_vector = encode_query(question)
+        scores = self.matrix[indices] @ query_vector
+        order = np.argsort(-scores, kind='stable')
+        return [(indices[i], float(scores[i])) for i in order]
+
+    def to_source(self, index: int) -> Dict:
+        """Node as a chat source; chunk_id is None because the text is a summary, not a chunk"""
+        node = self.nodes[index]
+        return {
+            'chunk_id': None,
+            'node_id': node['node_id'],
+            'level': node['level'],
+            'page_number': node['page_start'],
+            'page_end': node['page_end'],
+            'content': node['summary']
+        }
+
+
+def summary_tree_name(summary_name: str) -> str:
+    """Embedding matrix name for a summary artifact"""
+    return f"{summary_name.split('.')[0]}_tree_{model_slug()}.npy"
+
+
+def has_summary_tree(summarizer: DocumentSummarizer, pdf_path: Path) -> bool:
+    """Whether a PDF has a cached summary to build its tree from"""
+    cache = summarizer.extraction_cache
+    return cache.artifact_path(cache.compute_content_hash(pdf_path), summarizer.summary_name()).exists()
+
+
+_open_trees: ArtifactRegistry[SummaryTree] = ArtifactRegistry()
+
+
+def open_summary_tree(summarizer: DocumentSummarizer, pdf_path: Path) -> Optional[SummaryTree]:
+    """Summary tree of a PDF built from its cached summary, or None if the document was never summarized"""
+    cache = summarizer.extraction_cache
+    content_hash = cache.compute_content_hash(pdf_path)
+    summary_name = summarizer.summary_name()
+    summary_path = cache.artifact_path(content_hash, summary_name)
+
+    with _open_trees.lock:
+        if not summary_path.exists():
+            _open_trees.discard(summary_path)
+            return None
+        tree = _open_trees.get(summary_path)
+        if tree is not None:
+            return tree
+
+        summary = cache.load_json(content_hash, summary_name)
+        if summary is None:
+            return None
+        nodes = SummaryTree.nodes_from_summary(summary)
+
+        matrix = None
+        if embeddings_available() and nodes:
+            matrix_path = cache.artifact_path(content_hash, summary_tree_name(summary_name))
+            if not matrix_path.exists():
+                # A few dozen nodes at most; cheap next to the summaries themselves
+                with atomic_output(matrix_path) as tmp_path, open(tmp_path, 'wb') as f:
+                    np.save(f, encode_texts([node['summary'] for node in nodes]))
+            matrix = np.load(matrix_path)
+
+        tree = SummaryTree(nodes, matrix)
+        _open_trees.put(summary_path, tree)
+        return tree
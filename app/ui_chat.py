@@ -1,13 +1,28 @@
+import contextlib
 import re
 
+import numpy as np
 import streamlit as st
 import datetime
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
 from app.pdf_processor import PDFProcessor
-from app.gemini_helper import model
+from app.llm_client import get_llm_client
 from app.file_manager import FileManager
-from app.chat_memory import ChatMemoryManager
+from app.embeddings import EmbeddingIndex, embeddings_available, encode_query
+from app.chromadb_manager import chromadb_available, get_chromadb_manager
+from app.retrieval import HybridRetriever
+from app.context_packer import ContextPacker
+from app.summarizer import SUMMARY_INTERACTIVE_TIMEOUT_SECONDS, get_document_summarizer, is_summary_request
+from app.summary_tree import has_summary_tree, open_summary_tree
+from app.library_retrieval import LIBRARY_DISPLAY_NAME, LIBRARY_ID, get_library_retriever
+from app.query_cache import get_query_cache, index_version
+from app.answer_cache import LIBRARY_SCOPE, get_answer_cache
+
+RETRIEVAL_HYBRID = "Hybrid (BM25 + embeddings)"
+RETRIEVAL_KEYWORD = "Keyword (BM25)"
+RETRIEVAL_SEMANTIC = "Semantic (embeddings)"
+RETRIEVAL_VECTOR_DB = "Vector DB (ChromaDB)"
 
 
 class ChatWithPDFUI:
@@ -18,6 +33,8 @@ class ChatWithPDFUI:
         self.pdf_processor = PDFProcessor()
         self.chat_sidebar = chat_sidebar
         self.chat_memory = chat_memory
+        self.hybrid_retriever = HybridRetriever()
+        self.context_packer = ContextPacker()
        
         
         # Initialize session state for chat
@@ -29,6 +46,10 @@ class ChatWithPDFUI:
             st.session_state.selected_pdf_id = None
         if 'new_chat_clicked' not in st.session_state:
             st.session_state.new_chat_clicked = False
+        if 'retrieval_mode' not in st.session_state:
+            st.session_state.retrieval_mode = RETRIEVAL_HYBRID
+        if 'stream_answers' not in st.session_state:
+            st.session_state.stream_answers = True
     
     def run(self):
         """Main method to run the chat interface"""
@@ -69,6 +90,9 @@ class ChatWithPDFUI:
             st.warning("No successfully uploaded PDFs available.")
             return
         
+        # Library-wide chat over every successfully processed document
+        pdf_options[f"📚 {LIBRARY_DISPLAY_NAME} ({len(pdf_options)} files)"] = LIBRARY_ID
+        
         default_index = 0
         if st.session_state.selected_pdf_id:
             
@@ -92,7 +116,10 @@ class ChatWithPDFUI:
                 st.session_state.new_chat_clicked = False
             
             # Display current PDF info
-            file_info = metadata[selected_file_id]
+            if selected_file_id == LIBRARY_ID:
+                file_info = {'filename': LIBRARY_DISPLAY_NAME}
+            else:
+                file_info = metadata[selected_file_id]
             
             # Show current thread info if available
             current_thread_id = None
@@ -132,20 +159,26 @@ class ChatWithPDFUI:
     
     def load_pdf_content(self, file_id: str):
         """Load and process PDF content"""
+        if file_id == LIBRARY_ID:
+            # Library shards are opened per query from process-wide indexes, not held per session
+            st.session_state.selected_pdf_content = {'file_id': LIBRARY_ID, 'library': True}
+            return
+        
         file_path = self.file_manager.get_file_path(file_id)
         
         if file_path and file_path.exists():
             try:
-                pages_content = self.pdf_processor.extract_text_with_pages(file_path)
-                chunks = self.pdf_processor.create_pdf_chunks(pages_content)
+                # Memory-mapped and shared by every session that opens this document
+                store = self.pdf_processor.open_page_store(file_path)
                 
                 st.session_state.selected_pdf_content = {
-                    'pages': pages_content,
-                    'chunks': chunks,
+                    'store': store,
+                    'bm25': self.pdf_processor.open_bm25_index(file_path),
+                    'file_id': file_id,
                     'file_path': str(file_path)
                 }
                 
-                st.success(f"✅ Loaded {len(pages_content)} pages from PDF")
+                st.success(f"✅ Loaded {store.page_count} pages from PDF")
                 
             except Exception as e:
                 st.error(f"Error loading PDF: {str(e)}")
@@ -166,6 +199,14 @@ class ChatWithPDFUI:
         # Display chat history
         self.display_chat_history(file_id)
         
+        retrieval_modes = [RETRIEVAL_HYBRID, RETRIEVAL_KEYWORD]
+        if embeddings_available():
+            retrieval_modes.append(RETRIEVAL_SEMANTIC)
+            if chromadb_available():
+                retrieval_modes.append(RETRIEVAL_VECTOR_DB)
+        st.radio("Retrieval mode:", retrieval_modes, key="retrieval_mode", horizontal=True)
+        st.toggle("Stream answers", key="stream_answers")
+        
         # Chat input
         user_question = st.text_input(
             "Ask a question about the PDF:",
@@ -176,10 +217,12 @@ class ChatWithPDFUI:
         col1, col2 = st.columns([3, 1])
         
         with col1:
-            if st.button("Send", key=f"send_btn_{file_id}", type="primary"):
-                if user_question.strip():
-                    self.process_question(file_id, user_question)
-                    st.rerun()
+            send_clicked = st.button("Send", key=f"send_btn_{file_id}", type="primary")
+
+        # Answered outside the button column so a streamed answer gets the full page width
+        if send_clicked and user_question.strip():
+            self.process_question(file_id, user_question)
+            st.rerun()
 
 
     
@@ -202,7 +245,10 @@ class ChatWithPDFUI:
                     def format_source_markdown(source: Dict, index: int) -> str:
                         filename = source.get("filename", "Unknown Document")
                         page_number = source.get("page_number", "N/A")
-                        raw_content = source.get("content", "")
+                        page_end = source.get("page_end", page_number)
+                        if page_end != page_number:
+                            page_number = f"{page_number}–{page_end}"
+                        raw_content = self.get_source_content(source)
 
     # Clean up content:
                         cleaned = re.sub(r'\s+', ' ', raw_content)  # collapse newlines/tabs to single space
@@ -224,6 +270,12 @@ class ChatWithPDFUI:
                     # Display sources
                     if chat.get('sources'):
                         with st.expander("📚 Sources that contributed to your Answer", expanded=False):
+                            if chat.get('context'):
+                                context = chat['context']
+                                st.caption(
+                                    f"Context: {context['tokens_used']}/{context['token_budget']} tokens "
+                                    f"from {context['chunks_used']} of {context['candidates']} retrieved chunks"
+                                )
                             for j, source in enumerate(chat['sources']):
                                 st.markdown(format_source_markdown(source, j), unsafe_allow_html=False)
 
@@ -231,6 +283,16 @@ class ChatWithPDFUI:
                 st.divider()
         else:
             st.info("No messages yet. Start by asking a question about your PDF!")
+
+    def get_source_content(self, source: Dict) -> str:
+        """Read a source's text from the loaded chunk store, falling back to the stored copy"""
+        pdf_content = st.session_state.selected_pdf_content
+        chunk_id = source.get('chunk_id')
+        if (pdf_content and chunk_id is not None
+                and source.get('file_id') == pdf_content.get('file_id')
+                and chunk_id < len(pdf_content['store'])):
+            return pdf_content['store'].chunk_text(chunk_id)
+        return source.get('content', "")
     
     def process_question(self, file_id: str, question: str):
         """Process user question and generate answer with sources (integrated with thread system)"""
@@ -238,28 +300,48 @@ class ChatWithPDFUI:
             st.error("PDF content not loaded")
             return
         
-        with st.spinner("Generating answer..."):
+        stream = st.session_state.get('stream_answers', False)
+        # A streamed answer renders itself as it arrives, so it needs no spinner
+        with contextlib.nullcontext() if stream else st.spinner("Generating answer..."):
             try:
-                # Get relevant content and sources
-                relevant_chunks, sources = self.find_relevant_content(question)
-                
-                if not relevant_chunks:
-                    answer = "I couldn't find relevant information in the PDF to answer your question."
+                pdf_content = st.session_state.selected_pdf_content
+                context_report = None
+                if not pdf_content.get('library') and is_summary_request(question):
+                    # Whole-document questions get the map-reduce summary instead of a top-k slice
+                    answer = self.summarize_document(pdf_content)
                     sources = []
                 else:
-                    # Generate answer using Gemini
-                    answer = self.generate_answer_with_gemini(question, relevant_chunks)
+                    # Encoded at most once, and only if retrieval misses the query cache or the answer cache needs it
+                    query_vector = self.query_encoder(question)
+                    # Get relevant content and sources
+                    relevant_chunks, sources = self.find_relevant_content(question, query_vector)
+                    
+                    if not relevant_chunks:
+                        answer = "I couldn't find relevant information in the PDF to answer your question."
+                        sources = []
+                    else:
+                        # Deduplicate, merge adjacent chunks and cap the prompt at the token budget
+                        packed = self.context_packer.pack(sources)
+                        context_report = packed.report()
+                        # Generate answer using Gemini, unless a similar question over the same chunks was answered
+                        answer, sources = self.answer_question(file_id, question, packed.texts, packed.sources,
+                                                               stream=stream, query_vector=query_vector())
                 
                 # Get filename for sources
-                metadata = self.file_manager.load_metadata()
-                filename = metadata[file_id]['filename']
+                if file_id == LIBRARY_ID:
+                    filename = LIBRARY_DISPLAY_NAME
+                else:
+                    filename = self.file_manager.get_file_info(file_id)['filename']
                 
                 # Format sources with filename
                 formatted_sources = []
                 for source in sources:
                     formatted_sources.append({
-                        'filename': filename,
+                        'file_id': source.get('file_id', file_id),
+                        'filename': source.get('filename', filename),
+                        'chunk_id': source['chunk_id'],
                         'page_number': source['page_number'],
+                        'page_end': source['page_end'],
                         'content': source['content']
                     })
                 
@@ -268,6 +350,7 @@ class ChatWithPDFUI:
                     'question': question,
                     'answer': answer,
                     'sources': formatted_sources,
+                    'context': context_report,
                     'timestamp': datetime.datetime.now()
                 }
                 
@@ -278,7 +361,7 @@ class ChatWithPDFUI:
                     # Check if this is the first question in a new conversation
                     if not current_thread_id or st.session_state.new_chat_clicked:
                         # Create new thread with first question as title
-                        thread_id = self.chat_sidebar.create_thread_for_first_question(
+                        self.chat_sidebar.create_thread_for_first_question(
                             file_id, filename, question
                         )
                         # Clear existing history to start fresh
@@ -299,70 +382,227 @@ class ChatWithPDFUI:
             except Exception as e:
                 st.error(f"Error processing question: {str(e)}")
     
-    def find_relevant_content(self, question: str) -> Tuple[List[str], List[Dict]]:
+    @staticmethod
+    def query_encoder(question: str) -> Callable[[], Optional[np.ndarray]]:
+        """Callable returning the question's embedding, encoding it on the first call only"""
+        vectors: List[Optional[np.ndarray]] = []
+
+        def encode() -> Optional[np.ndarray]:
+            if not vectors:
+                vectors.append(encode_query(question) if embeddings_available() else None)
+            return vectors[0]
+        return encode
+    
+    def find_relevant_content(self, question: str,
+                              query_vector: Optional[Callable[[], Optional[np.ndarray]]] = None
+                              ) -> Tuple[List[str], List[Dict]]:
         """Find relevant content chunks based on the question"""
         if not st.session_state.selected_pdf_content:
             return [], []
         
-        chunks = st.session_state.selected_pdf_content['chunks']
+        pdf_content = st.session_state.selected_pdf_content
+        retrieval_mode = st.session_state.get('retrieval_mode')
         
-        # Simple keyword-based relevance scoring (can be enhanced with embedding similarity)
-        question_words = set(question.lower().split())
-        relevant_chunks = []
-        sources = []
+        # Repeated questions against an unchanged index are a dictionary lookup
+        query_cache = get_query_cache()
+        if pdf_content.get('library'):
+            cache_key = query_cache.make_key(question, LIBRARY_ID, None, index_version())
+        else:
+            # A summary tree built after a result was cached changes how broad questions are answered
+            mode = (retrieval_mode, self.summary_tree_available(pdf_content, retrieval_mode))
+            cache_key = query_cache.make_key(question, pdf_content['file_id'], mode,
+                                             index_version(pdf_content['file_id']))
+        ranked = query_cache.get(cache_key)
+        if ranked is None:
+            # Keyword retrieval never uses the embedding, so only the other modes pay for encoding on a miss
+            if query_vector is None:
+                query_vector = self.query_encoder(question)
+            vector = query_vector() if pdf_content.get('library') or retrieval_mode != RETRIEVAL_KEYWORD else None
+            ranked = self.rank_relevant_content(pdf_content, question, retrieval_mode, vector)
+            query_cache.put(cache_key, ranked)
+        
+        sources = self.sources_for(pdf_content, ranked)
+        return [source['content'] for source in sources], sources
+    
+    def rank_relevant_content(self, pdf_content: Dict, question: str, retrieval_mode: Optional[str],
+                              query_vector: Optional[np.ndarray] = None) -> List[Tuple[Tuple, float]]:
+        """Run retrieval for a question against the loaded PDF or the whole library
+
+        Returns (reference, score) pairs for the whole candidate pool, best first; the context
+        packer stops at its token budget. References are ('chunk', chunk_id) or ('node', node index)
+        for the loaded PDF and (file_id, chunk_id) for the library.
+        """
+        top_k = self.hybrid_retriever.candidate_pool
+        if pdf_content.get('library'):
+            return get_library_retriever().rank(question, self.file_manager.load_metadata(), top_k=top_k,
+                                                query_vector=query_vector)
+        
+        # In hybrid mode, broad questions over a summarized document are answered from the summary
+        # tree level that fits them; the single-ranker modes always search chunks as selected
+        if self.summary_tree_available(pdf_content, retrieval_mode):
+            tree = open_summary_tree(get_document_summarizer(self.file_manager.extraction_cache),
+                                     Path(pdf_content['file_path']))
+            level = tree.choose_level(question) if tree is not None else None
+            if level is not None:
+                return [(('node', index), score) for index, score in tree.search(question, level, query_vector)]
+        
+        ranked = None
+        if retrieval_mode == RETRIEVAL_SEMANTIC:
+            ranked = self.semantic_search(pdf_content, query_vector, top_k=top_k)
+        elif retrieval_mode == RETRIEVAL_VECTOR_DB:
+            ranked = self.vector_db_search(pdf_content, query_vector, top_k=top_k)
+        elif retrieval_mode == RETRIEVAL_KEYWORD:
+            # BM25 over the document's inverted index; only postings of the question's terms are visited
+            ranked = pdf_content['bm25'].search(question, top_k=top_k)
+        if ranked is None:
+            # Lexical and vector rankings fused with reciprocal-rank fusion (lexical only without embeddings)
+            ranked = self.hybrid_retriever.search(
+                question, pdf_content['bm25'], self.get_embedding_index(pdf_content), top_k=top_k,
+                query_vector=query_vector
+            )
+        
+        return [(('chunk', chunk_id), score) for chunk_id, score in ranked]
+    
+    def sources_for(self, pdf_content: Dict, ranked: List[Tuple[Tuple, float]]) -> List[Dict]:
+        """Sources for ranked references, with their text read from the shared page store or summary tree"""
+        if pdf_content.get('library'):
+            return get_library_retriever().to_sources(ranked, self.file_manager.load_metadata())
         
-        for chunk in chunks:
-            content_words = set(chunk['content'].lower().split())
-            overlap = len(question_words.intersection(content_words))
-            
-            if overlap > 0:  # Basic relevance check
-                relevance_score = overlap / len(question_words)
-                relevant_chunks.append({
-                    'content': chunk['content'],
-                    'page_number': chunk['page_number'],
-                    'score': relevance_score
-                })
-        
-        # Sort by relevance and take top 5 chunks
-        relevant_chunks.sort(key=lambda x: x['score'], reverse=True)
-        top_chunks = relevant_chunks[:5]
-        
-        # Prepare content and sources
-        content_texts = []
-        for chunk in top_chunks:
-            content_texts.append(chunk['content'])
-            sources.append({
-                'page_number': chunk['page_number'],
-                'content': chunk['content']
-            })
-        
-        return content_texts, sources
+        store = pdf_content['store']
+        tree = None
+        sources = []
+        for (kind, index), _ in ranked:
+            if kind == 'node':
+                if tree is None:
+                    tree = open_summary_tree(get_document_summarizer(self.file_manager.extraction_cache),
+                                             Path(pdf_content['file_path']))
+                if tree is not None and index < len(tree.nodes):
+                    sources.append(tree.to_source(index))
+            elif index < len(store):
+                sources.append(store[index].to_source())
+        return sources
+
+    def summary_tree_available(self, pdf_content: Dict, retrieval_mode: Optional[str]) -> bool:
+        """Whether retrieval may answer from the document's summary tree"""
+        if retrieval_mode not in (None, RETRIEVAL_HYBRID):
+            return False
+        return has_summary_tree(get_document_summarizer(self.file_manager.extraction_cache),
+                                Path(pdf_content['file_path']))
+
+    def get_embedding_index(self, pdf_content: Dict) -> Optional[EmbeddingIndex]:
+        """Embedding index of the loaded PDF, or None if embeddings are unavailable"""
+        if 'embeddings' not in pdf_content:
+            if not embeddings_available():
+                pdf_content['embeddings'] = None
+            else:
+                # Documents ingested before embeddings existed are encoded on first use
+                with st.spinner("Building embedding index..."):
+                    pdf_content['embeddings'] = self.pdf_processor.open_embedding_index(Path(pdf_content['file_path']))
+        return pdf_content['embeddings']
+
+    def semantic_search(self, pdf_content: Dict, query_vector: Optional[np.ndarray],
+                        top_k: int = 5) -> Optional[List[Tuple[int, float]]]:
+        """Top-k chunks by embedding similarity, or None if no embedding index can be loaded"""
+        embeddings = self.get_embedding_index(pdf_content) if query_vector is not None else None
+        if embeddings is None:
+            return None
+        return embeddings.search_vector(query_vector, top_k)
+
+    def vector_db_search(self, pdf_content: Dict, query_vector: Optional[np.ndarray],
+                         top_k: int = 5) -> Optional[List[Tuple[int, float]]]:
+        """Top-k chunks from the ChromaDB ANN index filtered to this file, or None if unavailable"""
+        manager = get_chromadb_manager()
+        if manager is None or query_vector is None:
+            return None
+        
+        file_id = pdf_content['file_id']
+        if not pdf_content.get('vector_db_indexed'):
+            if not manager.has_file(file_id):
+                # Documents ingested before the vector store existed are upserted on first use
+                embeddings = self.get_embedding_index(pdf_content)
+                if embeddings is None:
+                    return None
+                store = pdf_content['store']
+                manager.upsert_chunks(file_id, embeddings.matrix,
+                                      store.chunk_page_starts, store.chunk_page_ends)
+            pdf_content['vector_db_indexed'] = True
+        
+        matches = manager.query(query_vector, n_results=top_k, file_ids=[file_id])
+        # Records left from an older chunking of the file may point past its current store
+        size = len(pdf_content['store'])
+        return [(match['chunk_id'], match['score']) for match in matches if match['chunk_id'] < size]
+    
+    def summarize_document(self, pdf_content: Dict) -> str:
+        """Whole-document summary of the loaded PDF, from the summary cache when available"""
+        summarizer = get_document_summarizer(self.file_manager.extraction_cache)
+        file_path = Path(pdf_content['file_path'])
+        summary = summarizer.get_cached(file_path)
+        if summary is None:
+            with st.spinner("Summarizing the whole document..."):
+                summary = summarizer.summarize(file_path, pdf_content['store'],
+                                               timeout=SUMMARY_INTERACTIVE_TIMEOUT_SECONDS)
+        return summary['document']
+    
+    def answer_scope(self, file_id: str) -> str:
+        """Answer cache scope: the document's content hash, or the library"""
+        if file_id == LIBRARY_ID:
+            return LIBRARY_SCOPE
+        pdf_content = st.session_state.selected_pdf_content
+        return self.file_manager.extraction_cache.compute_content_hash(Path(pdf_content['file_path']))
     
-    def generate_answer_with_gemini(self, question: str, relevant_chunks: List[str]) -> str:
-        """Generate answer using Gemini API"""
+    def answer_question(self, file_id: str, question: str, relevant_chunks: List[str],
+                        sources: List[Dict], stream: bool = False,
+                        query_vector: Optional[np.ndarray] = None) -> Tuple[str, List[Dict]]:
+        """Answer from the semantic answer cache, or from Gemini on a miss"""
+        answer_cache = get_answer_cache(self.file_manager.extraction_cache)
+        scope = self.answer_scope(file_id)
+        chunk_ids = [
+            f"{source.get('file_id', file_id)}:{source.get('node_id') or source['chunk_id']}" for source in sources
+        ]
+        
+        question_key = answer_cache.question_key(question, query_vector)
+        cached = answer_cache.lookup(scope, question_key, chunk_ids)
+        if cached is not None:
+            return cached['answer'], cached['sources']
+        
         try:
-            # Combine relevant chunks
-            context = "\n\n".join(relevant_chunks)
-            
-            # Create prompt
-            prompt = f"""
-            Based on the following PDF content, please answer the user's question. 
-            If the answer is not available in the provided content, please say so.
-            
-            Context from PDF:
-            {context}
-            
-            Question: {question}
-            
-            Please provide a comprehensive answer based only on the information provided in the context.
-            """
-            
-            # Generate response
-            response = model.generate_content(prompt)
-            return response.text
-            
+            if stream:
+                answer = self.stream_gemini_answer(question, relevant_chunks)
+            else:
+                answer = self.request_gemini_answer(question, relevant_chunks)
         except Exception as e:
-            return f"Error generating answer: {str(e)}"
+            return f"Error generating answer: {str(e)}", sources
+        answer_cache.store(scope, question, question_key, chunk_ids, answer, sources)
+        return answer, sources
+    
+    def request_gemini_answer(self, question: str, relevant_chunks: List[str]) -> str:
+        """Call the LLM for an answer; errors propagate so failures are never cached"""
+        return get_llm_client().generate(self.build_prompt(question, relevant_chunks))
+    
+    def stream_gemini_answer(self, question: str, relevant_chunks: List[str]) -> str:
+        """Render the LLM's answer token by token in an assistant message and return the full text"""
+        with st.chat_message("user"):
+            st.write(question)
+        with st.chat_message("assistant"):
+            return st.write_stream(get_llm_client().stream(self.build_prompt(question, relevant_chunks)))
+    
+    @staticmethod
+    def build_prompt(question: str, relevant_chunks: List[str]) -> str:
+        """Prompt asking Gemini to answer from the retrieved PDF content only"""
+        # Combine relevant chunks
+        context = "\n\n".join(relevant_chunks)
+        
+        return f"""
+        Based on the following PDF content, please answer the user's question. 
+        If the answer is not available in the provided content, please say so.
+        
+        Context from PDF:
+        {context}
+        
+        Question: {question}
+        
+        Please provide a comprehensive answer based only on the information provided in the context.
+        """
 
 
 
@@ -8,13 +8,14 @@ from pathlib import Path
 import base64
 from typing import List, Dict, Tuple, Optional
 import re
-import time
-from app.file_manager import FileManager
+from app.file_manager import MAX_UPLOAD_MB, FileManager
+from app.ingestion import get_ingestion_pipeline
 class UploadDocumentUI:
     """Class for handling document upload interface"""
     
     def __init__(self, file_manager: FileManager):
         self.file_manager = file_manager
+        self.ingestion = get_ingestion_pipeline()
     
     def run(self):
         """Main method to run the upload interface"""
@@ -25,49 +26,52 @@ class UploadDocumentUI:
         uploaded_file = st.file_uploader(
             "Choose a PDF file",
             type=['pdf'],
-            help="Maximum file size: 5MB"
+            help=f"Maximum file size: {MAX_UPLOAD_MB}MB"
         )
         
         if uploaded_file is not None:
-            # Validate file size (5MB limit)
-            if uploaded_file.size > 5 * 1024 * 1024:
-                st.error("File size exceeds 5MB limit. Please choose a smaller file.")
-                return
-            
-            # Check if file already exists
-            existing_metadata = self.file_manager.load_metadata()
-            existing_files = [meta['filename'] for meta in existing_metadata.values()]
-            
-            if uploaded_file.name in existing_files:
-                st.warning(f"File '{uploaded_file.name}' already exists!")
+            # Validate file size (configurable with MAX_UPLOAD_MB)
+            if uploaded_file.size > self.file_manager.max_upload_size():
+                st.error(f"File size exceeds {MAX_UPLOAD_MB}MB limit. Please choose a smaller file.")
                 return
             
             # Upload button
             if st.button("Upload File", type="primary"):
                 with st.spinner("Uploading file..."):
                     try:
-                        # Create file ID and add metadata
-                        file_id = self.file_manager.add_file_metadata(
-                            uploaded_file.name,
-                            uploaded_file.size
-                        )
-                        
-                        # Save file
-                        file_path = self.file_manager.uploads_dir / uploaded_file.name
-                        with open(file_path, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
+                        # Stored by content hash; identical files share one copy and its processed data.
+                        # Written in fixed-size blocks, so the copy never holds the whole file
+                        uploaded_file.seek(0)
+                        progress_bar = st.progress(0.0, text="Saving file...")
+                        total = max(uploaded_file.size, 1)
                         
-                        # Update status to processing
-                        self.file_manager.update_file_status(file_id, 'processing')
+                        def report_progress(written: int):
+                            progress_bar.progress(
+                                min(written / total, 1.0),
+                                text=f"Saving file... {self.file_manager.format_file_size(written)}"
+                                     f" of {self.file_manager.format_file_size(uploaded_file.size)}"
+                            )
                         
-                        # Simulate processing time
-                        time.sleep(1)
+                        file_id, duplicates = self.file_manager.add_uploaded_file(
+                            uploaded_file.name,
+                            uploaded_file,
+                            progress=report_progress
+                        )
+                        progress_bar.empty()
+                        if file_id is None:
+                            st.warning(f"File '{uploaded_file.name}' already exists!")
+                            return
+                        if duplicates:
+                            st.info(f"Same content as '{duplicates[0]['filename']}'; "
+                                    "its processed data will be reused.")
                         
-                        # Update status to success
-                        self.file_manager.update_file_status(file_id, 'success')
+                        # Queue background extraction, chunking and indexing;
+                        # the job moves the status to 'success' or 'error'
+                        self.ingestion.submit(file_id)
                         
                         st.success(f"✅ File '{uploaded_file.name}' uploaded successfully!")
-                        st.balloons()
+                        st.info("The document is being processed in the background. "
+                                "It will be available for chat once its status shows Success in 'View Uploads'.")
                         
                         # Display file info
                         col1, col2, col3 = st.columns(3)
@@ -76,7 +80,7 @@ class UploadDocumentUI:
                         with col2:
                             st.metric("File Size", self.file_manager.format_file_size(uploaded_file.size))
                         with col3:
-                            st.metric("Status", "Ready")
+                            st.metric("Status", "Processing")
                         
                     except Exception as e:
                         st.error(f"Error uploading file: {str(e)}")
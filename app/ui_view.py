@@ -1,9 +1,16 @@
 import streamlit as st
 import base64
+import os
+import fitz
 import pandas as pd
 from typing import Dict
 from app.file_manager import FileManager
 
+# Larger files are previewed by their first page, since inlining base64-encodes the whole file into the page
+PREVIEW_INLINE_MAX_MB = int(os.environ.get("PREVIEW_INLINE_MAX_MB", 10))
+# Resolution of the first-page preview image
+PREVIEW_PAGE_DPI = 100
+
 class ViewUploadsUI:
     def __init__(self, file_manager: FileManager):
         self.file_manager = file_manager
@@ -21,6 +28,17 @@ class ViewUploadsUI:
         if 'selected_preview_file_id' not in st.session_state:
             st.session_state.selected_preview_file_id = None
 
+        # Background ingestion updates statuses; let the user pull the latest ones
+        pending = [info for info in metadata.values()
+                   if info.get('status') in ('uploading', 'processing')]
+        if pending:
+            col1, col2 = st.columns([0.8, 0.2])
+            with col1:
+                st.info(f"⏳ {len(pending)} document(s) still processing in the background.")
+            with col2:
+                if st.button("🔄 Refresh", key="refresh_statuses"):
+                    st.rerun()
+
         self.display_documents_table(metadata)
 
     def display_documents_table(self, metadata: Dict):
@@ -146,7 +164,17 @@ class ViewUploadsUI:
 
         file_path = self.file_manager.get_file_path(file_id)
 
-        if file_path and file_path.exists():
+        if file_path and file_path.exists() and file_path.stat().st_size > PREVIEW_INLINE_MAX_MB * 1024 * 1024:
+            try:
+                # Only the first page is loaded and rendered, so memory stays small whatever the file size
+                with fitz.open(file_path) as doc:
+                    page_count = len(doc)
+                    image = doc[0].get_pixmap(dpi=PREVIEW_PAGE_DPI).tobytes("png")
+                st.image(image, caption=f"Page 1 of {page_count}")
+                st.info(f"Files over {PREVIEW_INLINE_MAX_MB}MB are previewed by their first page only.")
+            except Exception as e:
+                st.error(f"Error previewing PDF: {str(e)}")
+        elif file_path and file_path.exists():
             try:
                 with open(file_path, "rb") as f:
                     base64_pdf = base64.b64encode(f.read()).decode("utf-8")
@@ -4,6 +4,8 @@ from app.ui_view import ViewUploadsUI
 from app.ui_chat import ChatWithPDFUI
 from app.chat_sidebar import ChatSidebar
 from app.chat_memory import ChatMemoryManager
+from app.metadata_store import metadata_cache
+from app.query_cache import get_query_cache
 
 import streamlit as st
 
@@ -50,11 +52,11 @@ class PDFSummarizerApp:
             )
 
             # File statistics
-            metadata = self.file_manager.load_metadata()
-            st.metric("Total Files", len(metadata))
-            if metadata:
-                total_size = sum(info['filesize'] for info in metadata.values())
-                st.metric("Total Storage", self.file_manager.format_file_size(total_size))
+            totals = self.file_manager.get_storage_totals()
+            st.metric("Total Files", totals['count'])
+            if totals['count']:
+                st.metric("Total Storage", self.file_manager.format_file_size(totals['total_size']))
+            self.render_cache_stats()
             
             st.markdown("---")
             
@@ -70,6 +72,16 @@ class PDFSummarizerApp:
         elif nav_option == "💬 Chat with PDF":
             self.chat_ui.run()
 
+    @staticmethod
+    def render_cache_stats():
+        """Process-wide cache hit rates, for sizing QUERY_CACHE_MAX_ENTRIES and spotting metadata churn"""
+        query_stats = get_query_cache().stats()
+        with st.expander("Cache statistics"):
+            for label, stats in (("Query results", query_stats), ("File metadata", metadata_cache.stats())):
+                st.caption(f"{label}: {stats['hits']} hits / {stats['misses']} misses "
+                           f"({stats['hit_rate']:.0%} hit rate)")
+            st.caption(f"Query results cached: {query_stats['entries']} of {query_stats['max_entries']}")
+
 def main():
     app = PDFSummarizerApp()
     app.run()
@@ -0,0 +1,18 @@
+from app.answer_cache import SemanticAnswerCache
+from app.extraction_cache import ExtractionCache
+
+
+def test_answers_from_other_processes_are_kept(tmp_path):
+    # Two caches over one directory stand in for two server processes
+    first = SemanticAnswerCache(ExtractionCache(tmp_path))
+    second = SemanticAnswerCache(ExtractionCache(tmp_path))
+    questions = ["What is the revenue?", "Who wrote the report?"]
+    for cache in (first, second):
+        cache.lookup("doc", cache.question_key(questions[0]), ["doc:1"])
+
+    first.store("doc", questions[0], first.question_key(questions[0]), ["doc:1"], "12m", [])
+    second.store("doc", questions[1], second.question_key(questions[1]), ["doc:2"], "Ada", [])
+
+    for cache in (first, second, SemanticAnswerCache(ExtractionCache(tmp_path))):
+        assert cache.lookup("doc", cache.question_key(questions[0]), ["doc:1"])['answer'] == "12m"
+        assert cache.lookup("doc", cache.question_key(questions[1]), ["doc:2"])['answer'] == "Ada"
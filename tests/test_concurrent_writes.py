@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+
+from app.chat_memory import ChatMemoryManager
+from app.file_manager import FileManager
+from app.json_store import read_json
+
+PROCESSES = 8
+OPERATIONS = 15
+
+
+def hammer(workdir: str, worker: int, shared_thread_id: str):
+    """Upload metadata, threads and messages as fast as possible from one process"""
+    # FileManager and ChatMemoryManager use paths relative to the working directory
+    os.chdir(workdir)
+    file_manager = FileManager()
+    chat_memory = ChatMemoryManager()
+    for i in range(OPERATIONS):
+        file_id = file_manager.add_file_metadata(f"w{worker}-{i}.pdf", 100)
+        thread_id = chat_memory.create_new_thread(file_id, f"w{worker}-{i}.pdf", f"question {worker}-{i}")
+        chat_memory.add_message_to_thread(thread_id, f"question {worker}-{i}", f"answer {worker}-{i}")
+        chat_memory.add_message_to_thread(shared_thread_id, f"shared {worker}-{i}", f"answer {worker}-{i}")
+
+
+def test_concurrent_processes_lose_no_updates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shared_thread_id = ChatMemoryManager().create_new_thread("shared", "shared.pdf", "shared question")
+
+    # Separate interpreters, as with several Streamlit servers sharing one data directory
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=hammer, args=(str(tmp_path), worker, shared_thread_id)) for worker in range(PROCESSES)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(timeout=300)
+        assert process.exitcode == 0
+
+    expected = {f"w{worker}-{i}.pdf" for worker in range(PROCESSES) for i in range(OPERATIONS)}
+
+    metadata = FileManager().load_metadata()
+    assert {info['filename'] for info in metadata.values()} == expected
+
+    chat_memory = ChatMemoryManager()
+    threads = chat_memory.load_threads_index()
+    shared = [thread for thread in threads if thread['thread_id'] == shared_thread_id]
+    threads = [thread for thread in threads if thread['thread_id'] != shared_thread_id]
+    assert len(threads) == len(expected)
+    assert {thread['pdf_filename'] for thread in threads} == expected
+    assert {thread['pdf_file_id'] for thread in threads} == set(metadata)
+    for thread in threads:
+        messages = read_json(chat_memory.chat_threads_dir / f"{thread['thread_id']}.json", [])
+        assert len(messages) == 1
+        assert thread['message_count'] == 1
+
+    shared_messages = read_json(chat_memory.chat_threads_dir / f"{shared_thread_id}.json", [])
+    assert len(shared_messages) == PROCESSES * OPERATIONS
+    assert shared[0]['message_count'] == PROCESSES * OPERATIONS
+
+
+def test_cleanup_orphaned_threads_removes_only_orphans(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chat_memory = ChatMemoryManager()
+    kept = chat_memory.create_new_thread("kept", "kept.pdf", "question")
+    orphan = chat_memory.create_new_thread("deleted", "deleted.pdf", "question")
+
+    assert chat_memory.cleanup_orphaned_threads(["kept"]) == 1
+    assert [thread['thread_id'] for thread in chat_memory.load_threads_index()] == [kept]
+    assert not (chat_memory.chat_threads_dir / f"{orphan}.json").exists()
+
+
+def test_message_count_survives_interleaved_appends(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first, second = ChatMemoryManager(), ChatMemoryManager()
+    thread_id = first.create_new_thread("file", "file.pdf", "question")
+
+    # Another session appends and updates the index between our append and our index update
+    update_index = first.update_threads_index
+
+    def other_session_appends_first(mutate):
+        second.add_message_to_thread(thread_id, "second question", "second answer")
+        return update_index(mutate)
+
+    monkeypatch.setattr(first, 'update_threads_index', other_session_appends_first)
+    first.add_message_to_thread(thread_id, "first question", "first answer")
+
+    assert first.get_thread_by_id(thread_id)['message_count'] == 2
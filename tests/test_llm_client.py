@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from app.llm_client import FakeProvider, LLMClient
+
+
+def test_closing_a_stream_releases_its_slot():
+    client = LLMClient(FakeProvider(latency_seconds=0.05, token_interval_seconds=0.5), max_concurrency=2)
+    streams = [client.stream("question", timeout=60) for _ in range(2)]
+    for stream in streams:
+        next(stream)
+        stream.close()
+
+    started = time.monotonic()
+    assert client.generate("next question", timeout=1.0)
+    assert time.monotonic() - started < 1.0
+
+
+def test_batch_deadline_cancels_pending_prompts():
+    client = LLMClient(FakeProvider(latency_seconds=0.5), max_concurrency=2, batch_max_concurrency=1)
+    started = time.monotonic()
+    finished = []
+    try:
+        for index, text in client.iter_generate_many(["a", "b", "c", "d"], total_timeout=0.8):
+            finished.append(index)
+        assert False, "the batch should exceed its deadline"
+    except TimeoutError:
+        pass
+    assert finished == [0]
+    assert time.monotonic() - started < 1.5
+
+
+
+def test_stream_past_its_deadline_closes_the_provider_stream():
+    closed = threading.Event()
+
+    class LateStreamProvider(FakeProvider):
+        async def stream(self, prompt):
+            try:
+                # Blocks the loop, so the first piece only arrives after the deadline
+                time.sleep(0.3)
+                yield "late "
+                yield "never"
+            finally:
+                closed.set()
+
+    client = LLMClient(LateStreamProvider(latency_seconds=0), max_concurrency=2)
+    with pytest.raises(TimeoutError, match="deadline"):
+        list(client.stream("question", timeout=0.2))
+    assert closed.wait(1.0)
+
+
+def test_zero_timeout_is_not_the_default():
+    client = LLMClient(FakeProvider(latency_seconds=0.2), max_concurrency=2)
+    with pytest.raises(TimeoutError, match="deadline"):
+        client.generate("question", timeout=0)
+
+
+def test_a_single_slot_is_rejected():
+    with pytest.raises(ValueError, match="at least 2"):
+        LLMClient(FakeProvider(), max_concurrency=1)
@@ -0,0 +1,35 @@
+import os
+import signal
+
+import fitz
+
+from app.pdf_processor import PDFProcessor, get_extraction_pool
+
+PAGES = 12
+WORKERS = 2
+
+
+def write_pdf(path):
+    with fitz.open() as doc:
+        for number in range(1, PAGES + 1):
+            doc.new_page().insert_text((72, 72), f"Page {number} text")
+        doc.save(path)
+
+
+def test_broken_pool_is_replaced_and_extraction_completes(tmp_path):
+    pdf_path = tmp_path / "doc.pdf"
+    write_pdf(pdf_path)
+
+    pool = get_extraction_pool(WORKERS)
+    assert pool.submit(os.getpid).result() > 0
+    # Simulate a worker killed by the OOM killer
+    for process in list(pool._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+
+    pages = list(PDFProcessor.iter_pages_parallel(pdf_path, PAGES, WORKERS))
+    assert [page['page_number'] for page in pages] == list(range(1, PAGES + 1))
+    assert pages[-1]['content'] == f"Page {PAGES} text"
+
+    fresh_pool = get_extraction_pool(WORKERS)
+    assert fresh_pool is not pool
+    assert len(list(PDFProcessor.iter_pages_parallel(pdf_path, PAGES, WORKERS))) == PAGES
@@ -0,0 +1,75 @@
+from app.chunker import PAGE_SEPARATOR, OffsetChunker
+from app.page_store import MappedPageStore
+
+PAGES = [
+    {'page_number': 1, 'content': "Revenue grew 12% in 2023, driven by exports."},
+    {'page_number': 2, 'content': ""},
+    {'page_number': 3, 'content': "Die Umsätze stiegen — größtenteils im Ausland. " * 6},
+    {'page_number': 4, 'content': "Costs: €4.2m (see table 7); margin ≈ 18%."},
+]
+
+
+def chunker_variants():
+    return [OffsetChunker(8, 2), OffsetChunker(8, 0, cross_pages=False), OffsetChunker(256, 32)]
+
+
+def spans(chunker, pages, byte_offsets=False):
+    return [(span.start, span.end, span.page_start, span.page_end, span.token_count)
+            for span in chunker.iter_page_chunks(iter(pages), byte_offsets=byte_offsets)]
+
+
+def test_chunks_overlap_and_cross_pages():
+    # Joined text "a b c d e\n\nf g h": tokens start at 0, 2, 4, 6, 8, 11, 13 and 15
+    pages = [{'page_number': 1, 'content': "a b c d e"}, {'page_number': 2, 'content': "f g h"}]
+    assert spans(OffsetChunker(4, 1), pages) == [(0, 7, 1, 1, 4), (6, 14, 1, 2, 4), (13, 16, 2, 2, 2)]
+    # Without crossing pages the window restarts at every page, overlap included
+    assert spans(OffsetChunker(4, 1, cross_pages=False), pages) == [(0, 7, 1, 1, 4), (6, 9, 1, 1, 2), (11, 16, 2, 2, 3)]
+    # Empty pages still count their separator
+    pages = [pages[0], {'page_number': 2, 'content': ""}, {'page_number': 3, 'content': "f g h"}]
+    assert spans(OffsetChunker(8, 0), pages) == [(0, 18, 1, 3, 8)]
+
+
+def test_byte_offsets_index_the_utf8_text():
+    pages = [{'page_number': 1, 'content': "é b"}, {'page_number': 2, 'content': "c"}]
+    assert spans(OffsetChunker(2, 0), pages) == [(0, 3, 1, 1, 2), (5, 6, 2, 2, 1)]
+    assert spans(OffsetChunker(2, 0), pages, byte_offsets=True) == [(0, 4, 1, 1, 2), (6, 7, 2, 2, 1)]
+
+
+def test_page_store_written_from_streamed_pages(tmp_path):
+    text = PAGE_SEPARATOR.join(page['content'] for page in PAGES).encode('utf-8')
+    for chunker in chunker_variants():
+        # The first configuration writes the text; later ones reuse it from the mapped file
+        MappedPageStore.write_pages(tmp_path, chunker.cache_key, iter(PAGES), chunker)
+        store = MappedPageStore(tmp_path / MappedPageStore.TEXT_NAME,
+                                tmp_path / MappedPageStore.index_name(chunker.cache_key))
+        try:
+            assert [store.page_text_at(i) for i in range(store.page_count)] == [p['content'] for p in PAGES]
+            expected = [(text[start:end].decode('utf-8'), page_start, page_end)
+                        for start, end, page_start, page_end, _ in spans(chunker, PAGES, byte_offsets=True)]
+            assert [(view.content, view.page_number, view.page_end) for view in store] == expected
+        finally:
+            store.close()
+
+
+def test_open_stores_are_bounded_and_evicted_by_content_hash(tmp_path, monkeypatch):
+    from app import page_store
+    from app.artifact_registry import ArtifactRegistry, evict_artifacts
+
+    registry = ArtifactRegistry(max_entries=2, close=MappedPageStore.close)
+    monkeypatch.setattr(page_store, '_open_stores', registry)
+    chunker = OffsetChunker(8, 2)
+    directories = [tmp_path / f"hash{i}" for i in range(3)]
+    for directory in directories:
+        MappedPageStore.write_pages(directory, chunker.cache_key, iter(PAGES), chunker)
+
+    stores = [page_store.open_page_store(directory, chunker.cache_key) for directory in directories]
+    assert len(registry) == 2
+    # The least recently used store was closed, and maps its file again when read
+    assert stores[0]._mmap is None
+    assert stores[0].page_text_at(0) == PAGES[0]['content']
+
+    evict_artifacts("hash2")
+    assert len(registry) == 1 and stores[2]._mmap is None
+    assert page_store.open_page_store(directories[1], chunker.cache_key) is stores[1]
+    for store in stores:
+        store.close()
@@ -0,0 +1,36 @@
+import pytest
+
+from app.summarizer import is_summary_request
+
+WHOLE_DOCUMENT_REQUESTS = [
+    "Summarize this document",
+    "Please summarise the whole report.",
+    "What is this PDF about?",
+    "what's the paper about",
+    "What is this about?",
+    "Can you summarize it?",
+    "Give me a summary",
+    "TL;DR",
+    "What are the main points of this document?",
+    "Give an overview of the entire book",
+]
+
+SPECIFIC_QUESTIONS = [
+    "Which table gives an overview of the 2023 costs?",
+    "What does the summary row on page 4 say?",
+    "Summarize the 2023 costs",
+    "What is the gist of the second clause?",
+    "What are the main points of the audit section?",
+    "Does the executive summary mention churn?",
+    "What is the file format used for exports?",
+]
+
+
+@pytest.mark.parametrize("question", WHOLE_DOCUMENT_REQUESTS)
+def test_whole_document_requests_are_summaries(question):
+    assert is_summary_request(question)
+
+
+@pytest.mark.parametrize("question", SPECIFIC_QUESTIONS)
+def test_specific_questions_are_not_summaries(question):
+    assert not is_summary_request(question)
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from app.chunker import OffsetChunker
+from app.extraction_cache import ExtractionCache
+from app.llm_client import FakeProvider, LLMClient
+from app.page_store import MappedPageStore
+from app.summarizer import DocumentSummarizer
+
+PAGES = [{'page_number': i, 'content': f"Page {i} talks about topic {i} in some detail."} for i in range(1, 7)]
+
+
+class FlakyProvider(FakeProvider):
+    """Fake backend failing every prompt that contains `failing_marker`"""
+
+    def __init__(self):
+        super().__init__(latency_seconds=0.01, token_interval_seconds=0)
+        self.failing_marker = None
+        self.calls = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.failing_marker is not None and self.failing_marker in prompt:
+            raise RuntimeError("backend down")
+        return await super().generate(prompt)
+
+
+def make_summarizer(tmp_path, provider):
+    # One page per section and two summaries per reduce call: 6 map calls, then 3 + 2 + 1 reduce calls
+    return DocumentSummarizer(ExtractionCache(tmp_path / "cache"), LLMClient(provider, max_concurrency=4),
+                              group_tokens=12, fan_in=2)
+
+
+def open_store(tmp_path):
+    chunker = OffsetChunker(8, 2)
+    MappedPageStore.write_pages(tmp_path / "store", chunker.cache_key, iter(PAGES), chunker)
+    return MappedPageStore(tmp_path / "store" / MappedPageStore.TEXT_NAME,
+                           tmp_path / "store" / MappedPageStore.index_name(chunker.cache_key))
+
+
+def write_pdf(tmp_path):
+    pdf_path = tmp_path / "doc.pdf"
+    pdf_path.write_bytes(b"%PDF- test")
+    return pdf_path
+
+
+def test_finished_sections_are_kept_and_resumed(tmp_path):
+    pdf_path = write_pdf(tmp_path)
+    provider = FlakyProvider()
+    summarizer = make_summarizer(tmp_path, provider)
+    store = open_store(tmp_path)
+    try:
+        provider.failing_marker = "topic 3 "
+        # A backend failure is reported as itself, not as a deadline to wait out
+        with pytest.raises(RuntimeError, match="backend down"):
+            summarizer.summarize(pdf_path, store, timeout=10)
+        assert summarizer.get_cached(pdf_path) is None
+
+        provider.failing_marker = None
+        provider.calls = 0
+        summary = summarizer.summarize(pdf_path, store, timeout=10)
+        # Only the failed section is summarized again before the reduce calls
+        assert provider.calls == 1 + 3 + 2 + 1
+        assert len(summary['sections']) == 6
+        assert summarizer.get_cached(pdf_path) == summary
+    finally:
+        store.close()
+
+
+def test_reduce_failure_falls_back_to_sections(tmp_path):
+    pdf_path = write_pdf(tmp_path)
+    provider = FlakyProvider()
+    summarizer = make_summarizer(tmp_path, provider)
+    store = open_store(tmp_path)
+    try:
+        content_hash = summarizer.extraction_cache.compute_content_hash(pdf_path)
+        sections = summarizer.map_sections(content_hash, summarizer.page_groups(store), time.monotonic() + 10)
+
+        provider.failing_marker = "Part 1:"
+        summary = summarizer.summarize(pdf_path, store, timeout=10)
+        assert summary['sections'] == sections
+        assert summary['document'] == summarizer.fallback_document(sections)
+        # The fallback is not cached, so a later call tries the reduce again
+        assert summarizer.get_cached(pdf_path) is None
+    finally:
+        store.close()
+
+
+
+def test_deadline_keeps_finished_sections(tmp_path):
+    pdf_path = write_pdf(tmp_path)
+    provider = FlakyProvider()
+    provider.latency_seconds = 0.3
+    summarizer = make_summarizer(tmp_path, provider)
+    store = open_store(tmp_path)
+    try:
+        # The client runs two batch calls at a time, so only the first two sections finish in time
+        with pytest.raises(TimeoutError, match="Summarized 2 of 6 sections.*ask again to resume"):
+            summarizer.summarize(pdf_path, store, timeout=0.45)
+        content_hash = summarizer.extraction_cache.compute_content_hash(pdf_path)
+        assert len(summarizer.extraction_cache.load_json(content_hash, summarizer.sections_name())['sections']) == 2
+    finally:
+        store.close()